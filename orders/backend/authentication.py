@@ -0,0 +1,110 @@
+"""
+Аутентификация по токену с кешем в памяти процесса.
+
+TokenAuthentication из DRF выполняет запрос Token + User на каждый
+запрос. CachedTokenAuthentication хранит результат проверки токена в
+LRU-кеше процесса на AUTH_TOKEN_CACHE_TTL секунд, повторные запросы с тем
+же токеном не обращаются к БД. Изменение пользователя (смена пароля,
+деактивация) и удаление токена (выход) сбрасывают его записи сразу в
+текущем процессе, в остальных процессах записи устаревают по TTL.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from backend.models import User
+
+
+class TokenCache:
+    """
+    LRU-кеш токен -> (пользователь, токен, время устаревания)
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # id пользователя -> его закешированные токены
+        self.user_keys = {}
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user, token, expires = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+        # у каждого запроса своя копия, изменения request.user не попадают в кеш
+        user, token = copy.copy(user), copy.copy(token)
+        token.user = user
+        return user, token
+
+    def set(self, key, user, token):
+        with self.lock:
+            self._remove(key)
+            self.entries[key] = (user, token, time.monotonic() + self.ttl)
+            self.user_keys.setdefault(user.id, set()).add(key)
+            while len(self.entries) > self.size:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate_key(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for key in list(self.user_keys.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.user_keys.get(entry[0].id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.user_keys[entry[0].id]
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        # неверный токен и неактивный пользователь не кешируются
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, copy.copy(user), copy.copy(token))
+        return user, token
+
+
+def user_changed(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.id)
+
+
+def token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate_key(instance.key)
+
+
+post_save.connect(user_changed, sender=User, dispatch_uid='token_cache_user_saved')
+post_delete.connect(user_changed, sender=User, dispatch_uid='token_cache_user_deleted')
+post_delete.connect(token_deleted, sender=Token, dispatch_uid='token_cache_token_deleted')
@@ -0,0 +1,127 @@
+"""
+Корзина покупателя.
+
+Позиции передаются списком {"shop_product": id позиции магазина,
+"quantity": количество}, повторы одной позиции в запросе объединяются.
+Все позиции проверяются одним запросом по id__in и записываются одним
+INSERT ... ON CONFLICT по (заказ, позиция магазина), поэтому число
+запросов не зависит от размера корзины. Изменения одной корзины
+выполняются последовательно: строка корзины блокируется до конца
+транзакции. Цены позиций корзины обновляются до текущих, а сумма и
+число позиций, хранящиеся в заказе, пересчитываются по ним после каждого
+изменения позиций; при оформлении цены позиций фиксируются.
+"""
+import json
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from backend.models import Order, OrderItem, ShopProduct
+
+MAX_ITEMS = 1000
+
+
+class BasketError(ValueError):
+    """
+    Ошибка в переданных позициях корзины
+    """
+
+
+def parse_items(raw):
+    """
+    {id позиции магазина: количество} из списка или JSON-строки
+    """
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            raise BasketError('Неверный формат запроса')
+    if not isinstance(raw, list) or not raw:
+        raise BasketError('Неверный формат запроса')
+    if len(raw) > MAX_ITEMS:
+        raise BasketError(f'Не больше {MAX_ITEMS} позиций за один запрос')
+    items = {}
+    for item in raw:
+        if not isinstance(item, dict):
+            raise BasketError(f'Неверный формат позиции: {item!r}')
+        shop_product, quantity = item.get('shop_product'), item.get('quantity')
+        if type(shop_product) != int or type(quantity) != int or quantity <= 0:
+            raise BasketError(f'Неверный формат позиции: {item!r}')
+        items[shop_product] = items.get(shop_product, 0) + quantity
+    return items
+
+
+def parse_ids(raw):
+    # id позиций магазина через запятую
+    ids = [item.strip() for item in str(raw).split(',')]
+    if not all(item.isdigit() for item in ids):
+        raise BasketError('Неверный формат запроса')
+    return [int(item) for item in ids]
+
+
+def order_totals():
+    """
+    Выражения для UPDATE заказов: сумма и число позиций по ценам позиций
+    """
+    items = OrderItem.objects.filter(order_id=OuterRef('id')).order_by().values('order_id')
+    return {
+        'total_sum': Coalesce(Subquery(items.annotate(
+            total=Sum(F('quantity') * F('price'))).values('total')), 0),
+        'items_count': Coalesce(Subquery(items.annotate(
+            count=Count('id')).values('count')), 0),
+    }
+
+
+def update_totals(orders, **fields):
+    # обновление цен позиций корзин из queryset до текущих и пересчёт хранимых
+    # сумм заказов, fields записываются тем же запросом; цены оформленных
+    # заказов не меняются
+    OrderItem.objects.filter(order__in=orders.filter(state='basket')).update(
+        price=Subquery(ShopProduct.objects.filter(id=OuterRef('shop_product_id')).values('price')[:1]))
+    return orders.update(**order_totals(), **fields)
+
+
+def items_queryset():
+    return OrderItem.objects.select_related(
+        'shop_product__shop', 'shop_product__product').order_by('id')
+
+
+def load_basket(user_id):
+    return Order.objects.filter(user_id=user_id, state='basket').prefetch_related(
+        Prefetch('ordered_items', queryset=items_queryset())).first()
+
+
+def save_items(user_id, items, replace=False):
+    """
+    Добавление позиций в корзину; при replace количество заменяется,
+    иначе прибавляется к уже лежащему в корзине
+    """
+    with transaction.atomic():
+        basket, _ = Order.objects.select_for_update().get_or_create(
+            user_id=user_id, state='basket')
+        found = set(ShopProduct.objects.filter(
+            id__in=list(items), shop__is_work=True).values_list('id', flat=True))
+        missing = sorted(set(items) - found)
+        if missing:
+            raise BasketError(f'Не найдены позиции магазинов: {missing}')
+        if not replace:
+            for shop_product_id, quantity in OrderItem.objects.filter(
+                    order_id=basket.id, shop_product_id__in=list(items)).values_list(
+                    'shop_product_id', 'quantity'):
+                items[shop_product_id] += quantity
+        OrderItem.objects.bulk_create(
+            [OrderItem(order_id=basket.id, shop_product_id=shop_product_id, quantity=quantity)
+             for shop_product_id, quantity in items.items()],
+            update_conflicts=True, unique_fields=['order', 'shop_product'],
+            update_fields=['quantity'])
+        update_totals(Order.objects.filter(id=basket.id))
+    return load_basket(user_id)
+
+
+def remove_items(user_id, shop_product_ids):
+    with transaction.atomic():
+        OrderItem.objects.filter(order__user_id=user_id, order__state='basket',
+                                 shop_product_id__in=shop_product_ids).delete()
+        update_totals(Order.objects.filter(user_id=user_id, state='basket'))
+    return load_basket(user_id)
@@ -0,0 +1,152 @@
+"""
+Оформление заказа из корзины с резервированием остатков.
+
+Остатки всех позиций заказа списываются одним условным UPDATE
+quantity = quantity - n WHERE quantity >= n в одной транзакции с
+переводом корзины в статус 'new': строка, для которой условие не
+выполнилось, означает нехватку товара, и тогда транзакция откатывается
+целиком, а покупатель получает список таких позиций. Строки остатков
+блокируются в порядке id, поэтому заказы с общими позициями не
+взаимоблокируются, а ожидание блокировки ограничено
+CHECKOUT_LOCK_TIMEOUT. Остатки на витрине обновляются тем же запросом,
+а хеш записи прайса у списанных позиций сбрасывается: повторная загрузка
+того же прайс-листа восстанавливает их остатки. После фиксации
+сбрасывается кеш остатков только магазинов из заказа.
+Для других СУБД остатки списываются тем же условием отдельным UPDATE
+на позицию. Вместе с заказом создаются заказы магазинов (ShopOrder) -
+по одному на каждый магазин с позициями в заказе.
+"""
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, OuterRef, Subquery
+
+from backend.models import CatalogOffer, Contact, Order, OrderItem, ShopOrder, ShopProduct
+from backend.response_cache import invalidate_stock
+from backend.signals import new_order
+
+# код ошибки PostgreSQL lock_not_available
+LOCK_NOT_AVAILABLE = '55P03'
+
+RESERVE_QUERY = """
+    WITH locked AS MATERIALIZED (
+        SELECT id FROM {shop_products} WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+    ), reserved AS (
+        UPDATE {shop_products} AS sp SET quantity = sp.quantity - line.quantity, content_hash = ''
+        FROM unnest(%s::integer[], %s::integer[]) AS line(id, quantity)
+        WHERE sp.id = line.id AND sp.id IN (SELECT id FROM locked) AND sp.quantity >= line.quantity
+        RETURNING sp.id, sp.quantity
+    ), offers AS (
+        UPDATE {offers} AS offer SET quantity = reserved.quantity
+        FROM reserved WHERE offer.shop_product_id = reserved.id
+    )
+    SELECT id FROM reserved
+"""
+
+
+class CheckoutError(ValueError):
+    """
+    Заказ не оформлен; failed - позиции, которых не хватило
+    """
+
+    def __init__(self, message, failed=()):
+        super().__init__(message)
+        self.failed = list(failed)
+
+
+def reserve_stock(lines):
+    """
+    Списание остатков {id позиции магазина: количество} вместе с
+    остатками на витрине и сбросом хеша записи прайса. Возвращает множество id позиций, остатков
+    которых хватило. Строки остатков заблокированы до конца транзакции
+    """
+    ids = sorted(lines)
+    if not ids:
+        return set()
+    if connection.vendor != 'postgresql':
+        reserved = {shop_product_id for shop_product_id in ids
+                    if ShopProduct.objects.filter(id=shop_product_id, quantity__gte=lines[shop_product_id]).update(
+                        quantity=F('quantity') - lines[shop_product_id], content_hash='')}
+        CatalogOffer.objects.filter(shop_product_id__in=reserved).update(quantity=Subquery(
+            ShopProduct.objects.filter(id=OuterRef('shop_product_id')).values('quantity')[:1]))
+        return reserved
+    query = RESERVE_QUERY.format(shop_products=connection.ops.quote_name(ShopProduct._meta.db_table),
+                                 offers=connection.ops.quote_name(CatalogOffer._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT set_config('lock_timeout', %s, true)",
+                       [f'{settings.CHECKOUT_LOCK_TIMEOUT}ms'])
+        cursor.execute(query, [ids, ids, [lines[shop_product_id] for shop_product_id in ids]])
+        return {row[0] for row in cursor.fetchall()}
+
+
+def place_order(user_id, order_id, contact_id):
+    """
+    Перевод корзины order_id в статус 'new' со списанием остатков
+    и разбиением на заказы магазинов
+    """
+    try:
+        with transaction.atomic():
+            order = Order.objects.select_for_update().filter(
+                id=order_id, user_id=user_id, state='basket').first()
+            if order is None:
+                raise CheckoutError('Корзина не найдена')
+            if not Contact.objects.filter(id=contact_id, user_id=user_id).exists():
+                raise CheckoutError('Контакт не найден')
+            items = list(OrderItem.objects.filter(order_id=order.id).select_related(
+                'shop_product__shop').order_by('id'))
+            if not items:
+                raise CheckoutError('Корзина пуста')
+            lines = {item.shop_product_id: item.quantity for item in items
+                     if item.shop_product is not None and item.shop_product.shop.is_work}
+            if len(lines) < len(items):
+                raise CheckoutError('Позиции недоступны для заказа', failed_lines(items, lines))
+            # суммы заказа и заказов магазинов фиксируются по ценам на момент оформления
+            shop_orders = split_order(order, items)
+            order.state, order.user_contact_id = 'new', contact_id
+            Order.objects.filter(id=order.id).update(
+                state=order.state, user_contact_id=contact_id,
+                total_sum=sum(shop_order.total_sum for shop_order in shop_orders),
+                items_count=len(items))
+            new_order.send(sender=Order, user_id=user_id, order_id=order.id)
+            # остатки списываются последним запросом транзакции,
+            # чтобы строки популярных позиций были заблокированы как можно меньше
+            reserved = reserve_stock(lines)
+            if len(reserved) < len(items):
+                raise CheckoutError('Недостаточно товара', failed_lines(items, reserved))
+            shop_ids = [shop_order.shop_id for shop_order in shop_orders]
+            transaction.on_commit(lambda: invalidate_stock(shop_ids))
+    except OperationalError as error:
+        if getattr(error.__cause__, 'pgcode', None) != LOCK_NOT_AVAILABLE:
+            raise
+        raise CheckoutError('Позиции заказа оформляются в других заказах, повторите попытку')
+    return order
+
+
+def split_order(order, items):
+    """
+    Заказы магазинов по позициям заказа: одна строка на магазин,
+    позиции привязываются к ней и получают цену на момент оформления
+    одним UPDATE
+    """
+    by_shop = {}
+    for item in items:
+        item.price = item.shop_product.price
+        by_shop.setdefault(item.shop_product.shop_id, []).append(item)
+    shop_orders = ShopOrder.objects.bulk_create(
+        [ShopOrder(order_id=order.id, shop_id=shop_id, items_count=len(shop_items),
+                   total_sum=sum(item.quantity * item.price for item in shop_items))
+         for shop_id, shop_items in by_shop.items()])
+    for shop_order in shop_orders:
+        for item in by_shop[shop_order.shop_id]:
+            item.shop_order_id = shop_order.id
+    OrderItem.objects.bulk_update(items, ['shop_order', 'price'])
+    return shop_orders
+
+
+def failed_lines(items, reserved):
+    # позиции без резерва с остатком на момент проверки
+    missing = [item for item in items if item.shop_product_id not in reserved]
+    available = dict(ShopProduct.objects.filter(
+        id__in=[item.shop_product_id for item in missing if item.shop_product_id is not None],
+        shop__is_work=True).values_list('id', 'quantity'))
+    return [{'shop_product': item.shop_product_id, 'requested': item.quantity,
+             'available': available.get(item.shop_product_id, 0)} for item in missing]
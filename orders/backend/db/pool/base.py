@@ -0,0 +1,120 @@
+"""
+Бэкенд PostgreSQL с пулом соединений внутри процесса.
+
+Соединение берётся из пула psycopg2 при первом запросе к БД и вместо
+закрытия возвращается в пул (при CONN_MAX_AGE = 0 - в конце каждого
+HTTP-запроса), поэтому запросы не тратят время на установку соединения,
+а число соединений процесса ограничено независимо от числа потоков
+(потоки ASGI-сервера, обработчики import_worker). Пул общий для потоков
+процесса и создаётся заново после fork.
+
+Настройки в DATABASES[alias]['POOL']: MIN_SIZE - сколько соединений
+открыть при создании пула, MAX_IDLE - сколько свободных соединений
+держать открытыми (по умолчанию MAX_SIZE), MAX_SIZE - предел соединений
+процесса, TIMEOUT - сколько секунд ждать свободного соединения. При
+CONN_HEALTH_CHECKS соединение из пула проверяется перед выдачей.
+"""
+import os
+import threading
+
+import psycopg2.extras
+from psycopg2 import extensions, pool
+
+from django.db.backends.postgresql import base
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool(pool.ThreadedConnectionPool):
+    """
+    ThreadedConnectionPool, который при исчерпании ждёт освобождения
+    соединения до timeout секунд, а не сразу выдаёт ошибку, и держит
+    открытыми до max_idle свободных соединений
+    """
+
+    def __init__(self, minconn, maxconn, timeout, max_idle=None, **kwargs):
+        super().__init__(minconn, maxconn, **kwargs)
+        # psycopg2 открывает minconn соединений при создании пула, а затем
+        # сравнивает с minconn число свободных при возврате соединения
+        self.minconn = max(minconn, min(maxconn, maxconn if max_idle is None else max_idle))
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise base.Database.OperationalError(
+                f'Нет свободных соединений в пуле за {self.timeout} сек.')
+        try:
+            return super().getconn(key)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        # слот освобождается только за соединение, которое пул принял:
+        # чужое или уже возвращённое соединение - ошибка вызывающего кода
+        super().putconn(conn, key, close)
+        self.slots.release()
+
+
+def get_pool(settings_dict, conn_params):
+    # отдельный пул на процесс и набор параметров подключения
+    key = (os.getpid(), tuple(sorted(conn_params.items())))
+    with _pools_lock:
+        if key not in _pools:
+            options = settings_dict.get('POOL', {})
+            _pools[key] = ConnectionPool(options.get('MIN_SIZE', 1), options.get('MAX_SIZE', 10),
+                                         options.get('TIMEOUT', 10), options.get('MAX_IDLE'),
+                                         **conn_params)
+        return _pools[key]
+
+
+def is_usable(connection):
+    if connection.closed or (connection.info.transaction_status
+                             == extensions.TRANSACTION_STATUS_UNKNOWN):
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(self.settings_dict, conn_params)
+        # в пуле не больше MAX_IDLE свободных соединений,
+        # неисправные отбрасываются и заменяются новыми
+        for _ in range(self.pool.minconn + 1):
+            connection = self.pool.getconn()
+            if not self.settings_dict['CONN_HEALTH_CHECKS'] or is_usable(connection):
+                break
+            self.pool.putconn(connection, close=True)
+        else:
+            raise base.Database.OperationalError('Не удалось получить исправное соединение из пула')
+
+        # то же, что в django.db.backends.postgresql: уровень изоляции
+        # и разбор jsonb на стороне JSONField
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            # незавершённая транзакция откатывается пулом,
+            # разорванное соединение закрывается
+            with self.wrap_database_errors:
+                return self.pool.putconn(self.connection)
@@ -0,0 +1,119 @@
+"""
+Чтение каталога с реплик.
+
+GET-запросы вьюсетов с ReplicaReadMixin читают с одной из реплик из
+settings.REPLICA_DATABASES. Реплики выбираются по кругу, реплика с
+отставанием больше REPLICA_MAX_LAG секунд или недоступная пропускается
+до следующей проверки через REPLICA_CHECK_INTERVAL секунд; если
+подходящих реплик нет, чтение идёт с основной БД. Реплика выбирается
+один раз на запрос, чтобы все его запросы видели одни и те же данные.
+Запись всегда идёт в основную БД, после первой записи и внутри
+транзакции чтение в том же запросе тоже переключается на основную БД.
+Остальные запросы и фоновые задачи работают только с основной БД.
+"""
+import itertools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# состояние текущего запроса, читающего с реплики
+_request = ContextVar('replica_request', default=None)
+
+LAG_QUERY = """
+    SELECT CASE WHEN NOT pg_is_in_recovery()
+                  OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END
+"""
+
+
+class ReplicaRequest:
+    def __init__(self):
+        self.alias = None
+        self.written = False
+
+
+@contextmanager
+def read_from_replica():
+    token = _request.set(ReplicaRequest())
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def replica_lag(alias):
+    # отставание реплики в секундах; для других СУБД реплики считаются синхронными
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_QUERY)
+        return cursor.fetchone()[0] or 0
+
+
+class ReplicaRouter:
+
+    def __init__(self):
+        self.replicas = list(getattr(settings, 'REPLICA_DATABASES', ()))
+        self.counter = itertools.count()
+        # alias -> (время проверки, реплика пригодна)
+        self.checked = {}
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        checked_at, healthy = self.checked.get(alias, (None, False))
+        if checked_at is not None and now - checked_at < settings.REPLICA_CHECK_INTERVAL:
+            return healthy
+        try:
+            healthy = replica_lag(alias) <= settings.REPLICA_MAX_LAG
+        except DatabaseError:
+            healthy = False
+        self.checked[alias] = (now, healthy)
+        return healthy
+
+    def choose_replica(self):
+        start = next(self.counter)
+        for offset in range(len(self.replicas)):
+            alias = self.replicas[(start + offset) % len(self.replicas)]
+            if self.is_healthy(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        request = _request.get()
+        if request is None:
+            return None
+        if request.written or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if request.alias is None:
+            request.alias = self.choose_replica()
+        return request.alias
+
+    def db_for_write(self, model, **hints):
+        request = _request.get()
+        if request is None:
+            return None
+        # объекты, прочитанные с реплики, сохраняются в основную БД
+        request.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *self.replicas}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Чтение GET- и HEAD-запросов вьюсета с реплики
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        with read_from_replica():
+            return super().dispatch(request, *args, **kwargs)
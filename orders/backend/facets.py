@@ -0,0 +1,203 @@
+"""
+Фильтры каталога по параметрам товаров.
+
+Ограничения передаются как ?param=Цвет:красный&param=Диагональ (дюйм):5..6.5.
+Значения одного параметра объединяются через ИЛИ, разные параметры - через И.
+Для числовых параметров вместо значения можно указать диапазон от..до,
+любая из границ может быть опущена.
+
+Число товаров по значениям параметров в каждой категории хранится в
+FacetValue и пересчитывается при импорте. Если заданы ограничения или
+поиск, счётчики считаются по ProductInf только для подходящих товаров.
+"""
+import math
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, Min, Q, Sum
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from backend.models import FacetValue, Parameter, Product, ProductInf
+from backend.search import ProductSearchFilter
+
+RANGE_SEPARATOR = '..'
+
+BATCH_SIZE = 1000
+
+
+def parse_number(value):
+    # числовое значение параметра для фильтров по диапазону, иначе None
+    try:
+        number = float(value.strip().replace(',', '.'))
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def parse_constraints(items):
+    """
+    {название параметра: [значение или (от, до)]} из значений ?param=
+    """
+    constraints = defaultdict(list)
+    for item in items:
+        name, separator, value = item.partition(':')
+        name, value = name.strip(), value.strip()
+        if not separator or not name:
+            raise ValidationError(
+                {'Errors': f'Неверный формат фильтра: {item}'})
+        if RANGE_SEPARATOR not in value:
+            constraints[name].append(value)
+            continue
+        bounds = [bound.strip()
+                  for bound in value.split(RANGE_SEPARATOR, 1)]
+        numbers = [parse_number(bound) if bound else None for bound in bounds]
+        if any(bound and number is None for bound, number in zip(bounds, numbers)):
+            raise ValidationError(
+                {'Errors': f'Неверный диапазон фильтра: {item}'})
+        constraints[name].append(tuple(numbers))
+    return dict(constraints)
+
+
+def value_query(conditions):
+    # условие на ProductInf.value/value_number для значений одного параметра
+    queries = []
+    values = [condition for condition in conditions if isinstance(condition, str)]
+    if values:
+        queries.append(Q(value__in=values))
+    for low, high in (condition for condition in conditions if isinstance(condition, tuple)):
+        query = Q(value_number__isnull=False)
+        if low is not None:
+            query &= Q(value_number__gte=low)
+        if high is not None:
+            query &= Q(value_number__lte=high)
+        queries.append(query)
+    return reduce(or_, queries)
+
+
+def request_constraints(request):
+    """
+    Список (название, id параметров, условие на значение) из запроса.
+    Неизвестный параметр даёт пустой список id и пустой результат
+    """
+    constraints = parse_constraints(request.query_params.getlist('param'))
+    if not constraints:
+        return []
+    ids = defaultdict(list)
+    for name, parameter_id in Parameter.objects.filter(
+            name__in=constraints).values_list('name', 'id'):
+        ids[name].append(parameter_id)
+    return [(name, ids[name], value_query(conditions))
+            for name, conditions in constraints.items()]
+
+
+def request_category(request):
+    category = request.query_params.get('category', '').strip()
+    if category and not category.isdigit():
+        raise ValidationError(
+            {'Errors': 'Неверный идентификатор категории'})
+    return int(category) if category else None
+
+
+def filter_products(queryset, constraints, prefix=''):
+    for name, parameter_ids, query in constraints:
+        queryset = queryset.filter(**{prefix + 'id__in': ProductInf.objects.filter(
+            query, parameter_id__in=parameter_ids).values('product_id')})
+    return queryset
+
+
+class ParameterFilter(BaseFilterBackend):
+    """
+    Фильтр по категории (?category=) и значениям параметров (?param=).
+    Путь от модели вьюсета до товара задаётся атрибутом search_product_path
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        prefix = getattr(view, 'search_product_path', '')
+        category = request_category(request)
+        if category is not None:
+            queryset = queryset.filter(**{prefix + 'category_id': category})
+        return filter_products(queryset, request_constraints(request), prefix)
+
+
+def value_counts(products, category, constraints, precomputed):
+    # строки (parameter_id, value, count, number) для товаров, подходящих под constraints
+    if precomputed and not constraints:
+        rows = FacetValue.objects.all()
+        if category is not None:
+            rows = rows.filter(category_id=category)
+        return rows.values('parameter_id', 'value').annotate(
+            count=Sum('count'), number=Min('value_number'))
+    if category is not None:
+        products = products.filter(category_id=category)
+    products = filter_products(products, constraints)
+    return ProductInf.objects.filter(product_id__in=products.values('id')).values(
+        'parameter_id', 'value').annotate(count=Count('product_id', distinct=True),
+                                          number=Min('value_number'))
+
+
+def facet_counts(request, view):
+    """
+    Число товаров по значениям параметров для текущего запроса.
+    Для параметра с ограничением учитываются ограничения только по
+    остальным параметрам, чтобы можно было выбрать ещё одно его значение
+    """
+    category = request_category(request)
+    constraints = request_constraints(request)
+    # без поиска и ограничений счётчики берутся из FacetValue
+    precomputed = not request.query_params.get('q', '').strip()
+    products = ProductSearchFilter().filter_queryset(
+        request, Product.objects.all(), view)
+    constrained = [parameter_id for _, parameter_ids, _ in constraints
+                   for parameter_id in parameter_ids]
+    rows = list(value_counts(products, category, constraints,
+                precomputed).exclude(parameter_id__in=constrained))
+    for name, parameter_ids, _ in constraints:
+        others = [constraint for constraint in constraints if constraint[0] != name]
+        rows += value_counts(products, category, others,
+                             precomputed).filter(parameter_id__in=parameter_ids)
+
+    names = dict(Parameter.objects.filter(
+        id__in={row['parameter_id'] for row in rows}).values_list('id', 'name'))
+    facets = {}
+    for row in rows:
+        name = names[row['parameter_id']]
+        facet = facets.setdefault(
+            name, {'parameter': name, 'type': 'number', 'values': {}})
+        value = facet['values'].setdefault(
+            row['value'], {'value': row['value'], 'number': row['number'], 'count': 0})
+        value['count'] += row['count']
+        if row['number'] is None:
+            facet['type'] = 'string'
+    result = []
+    for name in sorted(facets):
+        facet = facets[name]
+        values = list(facet.pop('values').values())
+        if facet['type'] == 'number':
+            values.sort(key=lambda value: value['number'])
+            facet['min'], facet['max'] = values[0]['number'], values[-1]['number']
+        else:
+            values.sort(key=lambda value: (-value['count'], value['value']))
+        facet['values'] = [{'value': value['value'], 'count': value['count']}
+                           for value in values]
+        result.append(facet)
+    return result
+
+
+def refresh_facet_index(category_ids, batch_size=BATCH_SIZE):
+    """
+    Пересчёт FacetValue для категорий category_ids
+    """
+    category_ids = sorted(category_ids)
+    for start in range(0, len(category_ids), batch_size):
+        ids = category_ids[start:start + batch_size]
+        FacetValue.objects.filter(category_id__in=ids).delete()
+        rows = ProductInf.objects.filter(product__category_id__in=ids).values(
+            'product__category_id', 'parameter_id', 'value').annotate(
+            count=Count('product_id', distinct=True), number=Min('value_number'))
+        FacetValue.objects.bulk_create(
+            [FacetValue(category_id=row['product__category_id'], parameter_id=row['parameter_id'],
+                        value=row['value'], value_number=row['number'], count=row['count'])
+             for row in rows.iterator()],
+            batch_size=batch_size)
@@ -0,0 +1,389 @@
+"""
+Пакетный импорт прайс-листа магазина.
+
+Категории, товары, параметры и позиции магазина разрешаются через заранее
+загруженные словари и записываются через INSERT ... ON CONFLICT по
+естественным ключам (bulk_create с update_conflicts/ignore_conflicts), поэтому
+число запросов зависит от количества таблиц и пакетов, а не от числа товаров,
+а одновременные загрузки разных продавцов не создают дублей.
+Django 4.1 не возвращает id строк из такого запроса, id новых строк
+перечитываются по ключу. Строки передаются в INSERT отсортированными по
+ключу конфликта: параллельные импорты с общими товарами блокируют их в
+одном порядке и не взаимоблокируются.
+Повторный импорт сравнивает хеш каждого товара с сохранённым и обрабатывает
+только новые и изменившиеся позиции. Хеши записываются в finish() вместе с
+удалением отсутствующих позиций: если импорт прервался, записанные товары
+при повторе обработаются заново.
+"""
+import hashlib
+import json
+import time
+
+from django.db import connection
+
+from backend.models import Category, Order, OrderItem, Product, ShopProduct, Parameter, ProductInf
+from backend.basket import update_totals
+from backend.facets import parse_number, refresh_facet_index
+from backend.read_model import refresh_offers
+from backend.search import update_search_vectors
+
+BATCH_SIZE = 1000
+
+# в PostgreSQL вставка товаров возвращает id только действительно вставленных строк
+INSERT_PRODUCTS = """
+    INSERT INTO {table} (name, model, category_id)
+    SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::integer[])
+    ON CONFLICT (name, model, category_id) DO NOTHING
+    RETURNING id, name, model, category_id
+"""
+
+TABLES = ('categories', 'products', 'shop_products',
+          'parameters', 'product_inf')
+
+
+class CatalogImportError(ValueError):
+    """
+    Ошибка в данных прайс-листа
+    """
+
+
+def chunks(items, size=BATCH_SIZE):
+    # разбиение последовательности на части не длиннее size
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def product_key(goods):
+    return goods['name'], goods['model'], goods['category']
+
+
+def content_hash(goods):
+    # хеш нормализованной записи товара, не зависит от порядка ключей
+    data = json.dumps(goods, sort_keys=True, ensure_ascii=False)
+    return hashlib.md5(data.encode('utf8')).hexdigest()
+
+
+def normalize_goods(item):
+    # приведение записи товара к типам полей моделей и расчёт её хеша
+    if not isinstance(item, dict):
+        raise CatalogImportError(f'Неверный формат товара: {item!r}')
+    try:
+        goods = {
+            'ext_id': int(item['id']),
+            'category': int(item['category']),
+            'model': str(item['model']),
+            'name': str(item['name']),
+            'price': int(item['price']),
+            'price_rrc': int(item['price_rrc']),
+            'quantity': int(item['quantity']),
+            'parameters': {str(name): str(value) for name, value
+                           in (item.get('parameters') or {}).items()},
+        }
+    except KeyError as exc:
+        raise CatalogImportError(
+            f'У товара отсутствует поле {exc}') from exc
+    except (TypeError, ValueError, AttributeError) as exc:
+        raise CatalogImportError(
+            f'Неверный формат товара {item.get("id")}: {exc}') from exc
+    goods['hash'] = content_hash(goods)
+    return goods
+
+
+class CatalogImporter:
+    """
+    Импорт категорий и товаров одного магазина.
+    Вызывающий код отвечает за транзакции вокруг вызовов, сброс кеша по
+    take_changes() после каждой из них и вызов finish() в конце или
+    abort() при ошибке.
+    """
+
+    def __init__(self, shop, batch_size=BATCH_SIZE):
+        self.shop = shop
+        self.batch_size = batch_size
+        self.stats = {table: {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0}
+                      for table in TABLES}
+        self.category_ids = set()
+        # категории, для которых нужно пересчитать индекс фильтров
+        self.facet_category_ids = set()
+        self.ext_ids = set()
+        # раздел goods встретился в файле, пусть и пустой
+        self.goods_seen = False
+        self.parameters = {}
+        # хеши изменившихся позиций {id: хеш} до finish()
+        self.hashes = {}
+        # таблицы, изменённые после последнего take_changes()
+        self.dirty = set()
+        self.started = time.monotonic()
+
+    def _count(self, table, inserted=0, updated=0, unchanged=0, deleted=0):
+        self.stats[table]['inserted'] += inserted
+        self.stats[table]['updated'] += updated
+        self.stats[table]['unchanged'] += unchanged
+        self.stats[table]['deleted'] += deleted
+        if inserted or updated or deleted:
+            self.dirty.add(table)
+
+    def import_categories(self, categories):
+        try:
+            categories = {int(category['id']): str(category['name'])
+                          for category in categories}
+        except (KeyError, TypeError, ValueError) as exc:
+            raise CatalogImportError(
+                f'Неверный формат категории: {exc}') from exc
+        existing = {}
+        for ids in chunks(categories, self.batch_size):
+            existing.update(Category.objects.in_bulk(ids))
+        created = [category_id for category_id in categories if category_id not in existing]
+        renamed = [category_id for category_id, category in existing.items()
+                   if category.name != categories[category_id]]
+        Category.objects.bulk_create(
+            [Category(id=category_id, name=categories[category_id])
+             for category_id in sorted(created + renamed)],
+            update_conflicts=True, unique_fields=['id'], update_fields=['name'],
+            batch_size=self.batch_size)
+        self._count('categories', len(created), len(renamed),
+                    len(categories) - len(created) - len(renamed))
+        refresh_offers(category_ids=renamed, batch_size=self.batch_size)
+
+        # связь категорий с магазином, уже существующие пропускаются
+        through = Category.shops.through
+        through.objects.bulk_create(
+            [through(shop_id=self.shop.id, category_id=category_id)
+             for category_id in sorted(categories)],
+            ignore_conflicts=True, batch_size=self.batch_size)
+        self.category_ids.update(categories)
+
+    def import_goods(self, goods):
+        self.import_normalized([normalize_goods(item) for item in goods])
+
+    def import_normalized(self, goods):
+        # при повторе ext_id в файле побеждает последняя запись
+        goods = list({item['ext_id']: item for item in goods}.values())
+        self.goods_seen = True
+        self.ext_ids.update(item['ext_id'] for item in goods)
+        existing = self._load_shop_products(goods)
+        # товары с неизменным хешем дальше не обрабатываются
+        goods = [item for item in goods if item['ext_id'] not in existing
+                 or existing[item['ext_id']].content_hash != item['hash']]
+        self._count('shop_products', unchanged=len(existing) - sum(
+            item['ext_id'] in existing for item in goods))
+        if not goods:
+            return
+        self._check_categories(goods)
+        products = self._resolve_products(goods)
+        shop_product_ids = self._save_shop_products(goods, products, existing)
+        self._resolve_parameters(goods)
+        product_ids = self._save_product_inf(goods, products)
+        self.facet_category_ids.update(item['category'] for item in goods)
+        refresh_offers(shop_product_ids, product_ids, batch_size=self.batch_size)
+
+    def delete_missing(self):
+        # удаление позиций магазина, которых нет в загруженном файле
+        missing = [shop_product_id for shop_product_id, ext_id
+                   in ShopProduct.objects.filter(shop_id=self.shop.id).values_list('id', 'ext_id').iterator()
+                   if ext_id not in self.ext_ids]
+        for ids in chunks(missing, self.batch_size):
+            ShopProduct.objects.filter(id__in=ids).delete()
+        self._count('shop_products', deleted=len(missing))
+
+    def refresh_facets(self):
+        refresh_facet_index(self.facet_category_ids)
+        self.facet_category_ids.clear()
+
+    def basket_ids(self):
+        return list(Order.objects.filter(
+            state='basket', ordered_items__shop_product__shop_id=self.shop.id).values_list(
+            'id', flat=True).distinct())
+
+    def update_baskets(self, basket_ids):
+        # цены и удалённые позиции магазина меняют суммы корзин покупателей
+        counts = self.stats['shop_products']
+        if not counts['updated'] and not counts['deleted']:
+            return
+        for ids in chunks(basket_ids, self.batch_size):
+            update_totals(Order.objects.filter(id__in=ids))
+
+    def save_hashes(self):
+        ShopProduct.objects.bulk_update(
+            [ShopProduct(id=shop_product_id, content_hash=value)
+             for shop_product_id, value in self.hashes.items()],
+            ['content_hash'], batch_size=self.batch_size)
+        self.hashes.clear()
+
+    def finish(self):
+        # после записи всех пакетов: удаление отсутствующих позиций,
+        # пересчёт индекса фильтров и сумм корзин, запись хешей
+        if not self.goods_seen:
+            # без раздела goods удаление отсутствующих позиций очистило бы магазин
+            raise CatalogImportError('В прайс-листе нет раздела goods')
+        basket_ids = self.basket_ids()
+        self.delete_missing()
+        self.refresh_facets()
+        self.update_baskets(basket_ids)
+        self.save_hashes()
+
+    def abort(self):
+        # после ошибки: индекс фильтров и суммы корзин приводятся в соответствие
+        # с уже записанными пакетами; их хеши не сохраняются, при повторе
+        # эти товары обработаются заново
+        self.hashes.clear()
+        self.refresh_facets()
+        self.update_baskets(self.basket_ids())
+
+    def take_changes(self):
+        # таблицы, изменённые после предыдущего вызова, для сброса кеша
+        tables, self.dirty = self.dirty, set()
+        return tables
+
+    def result(self):
+        stats = {table: dict(counts) for table, counts in self.stats.items()}
+        stats['elapsed'] = round(time.monotonic() - self.started, 3)
+        return stats
+
+    def _check_categories(self, goods):
+        missing = {item['category'] for item in goods} - self.category_ids
+        if missing:
+            self.category_ids.update(Category.objects.filter(
+                id__in=missing).values_list('id', flat=True))
+            missing -= self.category_ids
+        if missing:
+            raise CatalogImportError(
+                f'Не найдены категории: {sorted(missing)}')
+
+    def _load_products(self, keys):
+        products = {}
+        for names in chunks({key[0] for key in keys}, self.batch_size):
+            rows = Product.objects.filter(name__in=names).values_list(
+                'id', 'name', 'model', 'category_id')
+            for product_id, *key in rows:
+                key = tuple(key)
+                if key in keys:
+                    products[key] = product_id
+        return products
+
+    def _resolve_products(self, goods):
+        keys = {product_key(item) for item in goods}
+        products = self._load_products(keys)
+        missing = {key for key in keys if key not in products}
+        created = self._insert_products(missing) if missing else {}
+        products.update(created)
+        # товар мог создать параллельный импорт, такие строки читаются заново
+        # и считаются неизменными
+        skipped = missing - created.keys()
+        if skipped:
+            products.update(self._load_products(skipped))
+        update_search_vectors(list(created.values()))
+        self._count('products', inserted=len(created),
+                    unchanged=len(keys) - len(created))
+        return products
+
+    def _insert_products(self, keys):
+        # {ключ: id} вставленных товаров, уже существующие пропускаются
+        if connection.vendor != 'postgresql':
+            # bulk_create не отличает вставленные строки от пропущенных
+            Product.objects.bulk_create(
+                [Product(name=name, model=model, category_id=category_id)
+                 for name, model, category_id in sorted(keys)],
+                ignore_conflicts=True, batch_size=self.batch_size)
+            return self._load_products(keys)
+        created = {}
+        query = INSERT_PRODUCTS.format(table=connection.ops.quote_name(Product._meta.db_table))
+        with connection.cursor() as cursor:
+            for chunk in chunks(sorted(keys), self.batch_size):
+                cursor.execute(query, [[key[0] for key in chunk], [key[1] for key in chunk],
+                                       [key[2] for key in chunk]])
+                created.update((tuple(key), product_id) for product_id, *key in cursor.fetchall())
+        return created
+
+    def _load_shop_products(self, goods):
+        existing = {}
+        for ext_ids in chunks([item['ext_id'] for item in goods], self.batch_size):
+            rows = ShopProduct.objects.filter(
+                shop_id=self.shop.id, ext_id__in=ext_ids).only('id', 'ext_id', 'content_hash')
+            for shop_product in rows:
+                existing[shop_product.ext_id] = shop_product
+        return existing
+
+    def _save_shop_products(self, goods, products, existing):
+        ShopProduct.objects.bulk_create(
+            [ShopProduct(shop_id=self.shop.id,
+                         ext_id=item['ext_id'],
+                         product_id=products[product_key(item)],
+                         quantity=item['quantity'],
+                         price=item['price'],
+                         price_rrc=item['price_rrc'],
+                         content_hash='')
+             for item in sorted(goods, key=lambda item: item['ext_id'])],
+            update_conflicts=True, unique_fields=['shop', 'ext_id'],
+            update_fields=['product', 'quantity', 'price', 'price_rrc', 'content_hash'],
+            batch_size=self.batch_size)
+        created = [item['ext_id'] for item in goods if item['ext_id'] not in existing]
+        self._count('shop_products', len(created), len(goods) - len(created))
+        ids = {item['ext_id']: existing[item['ext_id']].id
+               for item in goods if item['ext_id'] in existing}
+        if created:
+            ids.update(ShopProduct.objects.filter(
+                shop_id=self.shop.id, ext_id__in=created).values_list('ext_id', 'id'))
+        self.hashes.update((ids[item['ext_id']], item['hash']) for item in goods)
+        return list(ids.values())
+
+    def _resolve_parameters(self, goods):
+        self.prepare_parameters(
+            {name for item in goods for name in item['parameters']})
+
+    def prepare_parameters(self, names):
+        # id параметров кешируются на весь импорт
+        missing = set(names) - self.parameters.keys()
+        if not missing:
+            return
+        self._load_parameters(missing)
+        unchanged = len(missing & self.parameters.keys())
+        missing = [name for name in missing if name not in self.parameters]
+        Parameter.objects.bulk_create(
+            [Parameter(name=name) for name in sorted(missing)],
+            ignore_conflicts=True, batch_size=self.batch_size)
+        self._load_parameters(missing)
+        self._count('parameters', inserted=len(missing), unchanged=unchanged)
+
+    def _load_parameters(self, names):
+        for chunk in chunks(names, self.batch_size):
+            self.parameters.update(Parameter.objects.filter(
+                name__in=chunk).values_list('name', 'id'))
+
+    def _save_product_inf(self, goods, products):
+        # значения параметров товаров приводятся к файлу: новые вставляются,
+        # изменившиеся обновляются, отсутствующие в записи товара удаляются
+        values = {}
+        product_ids = set()
+        for item in goods:
+            product_id = products[product_key(item)]
+            product_ids.add(product_id)
+            for name, value in item['parameters'].items():
+                values[product_id, self.parameters[name]] = value
+        existing = {}
+        stale = []
+        for chunk in chunks(product_ids, self.batch_size):
+            for product_inf_id, product_id, parameter_id, value in ProductInf.objects.filter(
+                    product_id__in=chunk).values_list('id', 'product_id', 'parameter_id', 'value'):
+                existing[product_id, parameter_id] = value
+                if (product_id, parameter_id) not in values:
+                    stale.append((product_id, product_inf_id))
+        changed = sorted(key for key, value in values.items() if existing.get(key) != value)
+        ProductInf.objects.bulk_create(
+            [ProductInf(product_id=product_id, parameter_id=parameter_id,
+                        value=values[product_id, parameter_id],
+                        value_number=parse_number(values[product_id, parameter_id]))
+             for product_id, parameter_id in changed],
+            update_conflicts=True, unique_fields=['product', 'parameter'],
+            update_fields=['value', 'value_number'], batch_size=self.batch_size)
+        for chunk in chunks([product_inf_id for _, product_inf_id in stale], self.batch_size):
+            # позиции старых заказов, ссылающиеся на значение, не удаляются каскадом
+            OrderItem.objects.filter(product_info_id__in=chunk).update(product_info=None)
+            ProductInf.objects.filter(id__in=chunk).delete()
+        created = sum(key not in existing for key in changed)
+        self._count('product_inf', created, len(changed) - created,
+                    len(values) - len(changed), len(stale))
+        # товары с изменившимися параметрами, их позиции в других магазинах
+        # тоже обновляются в витрине
+        return {product_id for product_id, _ in changed} | {product_id for product_id, _ in stale}
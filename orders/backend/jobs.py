@@ -0,0 +1,147 @@
+"""
+Очередь фоновых задач импорта прайс-листов в БД.
+Задачи выполняет команда `manage.py import_worker`.
+"""
+import hashlib
+import io
+import os
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from backend.models import ImportJob, ShopFiles, ShopProduct
+from backend.parallel_import import import_price_list_parallel
+from backend.price_list import import_price_list
+
+
+def file_checksum(chunks):
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def last_applied_checksum(user):
+    """
+    Контрольная сумма файла последней завершённой задачи продавца. Если
+    она упала (пакеты, записанные до ошибки, остаются) или у позиций
+    магазина сброшен хеш (остатки списаны заказом), каталог не совпадает
+    ни с одним файлом, и ни один файл не пропускается
+    """
+    if ShopProduct.objects.filter(shop__seller_id=user, content_hash='').exists():
+        return None
+    job = ImportJob.objects.filter(user_id=user, state__in=('done', 'failed')).order_by(
+        '-id').values_list('state', 'file__checksum').first()
+    if job is None or job[0] != 'done':
+        return None
+    return job[1]
+
+
+def claim_jobs(limit):
+    """
+    Захват до limit задач из очереди. Условный UPDATE гарантирует, что одну
+    задачу не заберут два обработчика одновременно
+    """
+    release_stale_jobs()
+    claimed = []
+    queued = ImportJob.objects.filter(state='queued').order_by(
+        'created_at').values_list('id', flat=True)[:limit]
+    for job_id in queued:
+        now = timezone.now()
+        if ImportJob.objects.filter(id=job_id, state='queued').update(
+                state='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1):
+            claimed.append(job_id)
+    return claimed
+
+
+def release_stale_jobs():
+    """
+    Задачи, обработчик которых не отмечался дольше IMPORT_JOB_TIMEOUT
+    (процесс или сервер остановлен), возвращаются в очередь, а после
+    IMPORT_JOB_MAX_ATTEMPTS запусков завершаются ошибкой
+    """
+    now = timezone.now()
+    deadline = now - timedelta(seconds=settings.IMPORT_JOB_TIMEOUT)
+    stale = ImportJob.objects.filter(
+        Q(heartbeat_at__lt=deadline) | Q(heartbeat_at__isnull=True, started_at__lt=deadline),
+        state='running')
+    failed = stale.filter(attempts__gte=settings.IMPORT_JOB_MAX_ATTEMPTS).update(
+        state='failed', error='Обработчик задачи не отвечает', finished_at=now)
+    requeued = stale.filter(attempts__lt=settings.IMPORT_JOB_MAX_ATTEMPTS).update(
+        state='queued', progress=0)
+    return requeued, failed
+
+
+def fail_job(job_id, error):
+    ImportJob.objects.filter(id=job_id, state='running').update(
+        state='failed', error=error, finished_at=timezone.now())
+
+
+class Heartbeat(threading.Thread):
+    """
+    Отметка выполняющейся задачи раз в IMPORT_JOB_HEARTBEAT секунд из
+    отдельного потока (и соединения), чтобы долгие пакеты и finish()
+    не выглядели зависанием
+    """
+
+    def __init__(self, jobs):
+        super().__init__(daemon=True)
+        self.jobs = jobs
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.IMPORT_JOB_HEARTBEAT):
+                self.jobs.update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_import_job(job_id, processes=1):
+    # выполняется в дочернем процессе обработчика;
+    # при processes > 1 товары разбираются параллельно
+    job = ImportJob.objects.select_related('file').get(id=job_id)
+    path = job.file.file.path
+    # задача, возвращённая в очередь и захваченная заново, обновляется только
+    # последним запуском
+    jobs = ImportJob.objects.filter(id=job_id, state='running', attempts=job.attempts)
+    if job.file.checksum and job.file.checksum == last_applied_checksum(job.user_id):
+        # файл совпадает с уже применённым, импорт не нужен
+        jobs.update(state='done', progress=100, stats={'skipped': True},
+                    finished_at=timezone.now())
+        ShopFiles.objects.filter(id=job.file_id).update(
+            shop=job.user.shop)
+        return True
+    heartbeat = Heartbeat(jobs)
+    heartbeat.start()
+    try:
+        size = os.path.getsize(path) or 1
+        with open(path, 'rb') as stream:
+            def on_batch(importer):
+                progress = min(99, stream.tell() * 100 // size)
+                jobs.update(progress=progress, stats=importer.result(),
+                            heartbeat_at=timezone.now())
+
+            if processes > 1:
+                importer = import_price_list_parallel(
+                    io.TextIOWrapper(stream, encoding='utf8'), job.user_id, processes, on_batch=on_batch)
+            else:
+                importer = import_price_list(stream, job.user_id, on_batch)
+    except Exception as exc:
+        jobs.update(state='failed', error=f'{exc.__class__.__name__}: {exc}',
+                    finished_at=timezone.now())
+        return False
+    finally:
+        heartbeat.stop()
+    jobs.update(state='done', progress=100, stats=importer.result(),
+                finished_at=timezone.now())
+    ShopFiles.objects.filter(id=job.file_id).update(shop=importer.shop)
+    return True
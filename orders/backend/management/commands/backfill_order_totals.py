@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from backend.basket import update_totals
+from backend.importer import chunks
+from backend.models import Order
+
+
+class Command(BaseCommand):
+    help = ('Обновление цен позиций, хранимых сумм и числа позиций корзин по текущим '
+            'ценам пакетами, каждый пакет в своей транзакции; оформленные заказы '
+            'не пересчитываются, их суммы зафиксированы при оформлении')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Заказов в пакете')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пакета должен быть положительным')
+        ids = list(Order.objects.filter(state='basket').order_by('id').values_list('id', flat=True))
+        updated = 0
+        for batch in chunks(ids, options['batch_size']):
+            with transaction.atomic():
+                updated += update_totals(Order.objects.filter(id__in=batch))
+            self.stdout.write(f'Пересчитано заказов: {updated} из {len(ids)}')
@@ -0,0 +1,144 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory
+from django.test.utils import setup_test_environment
+
+MODES = ('close', 'persistent', 'pool')
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = ('Замер задержки запросов к API при разных режимах соединений с БД '
+            '(DB_CONN_MODE), отчёт в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default=','.join(MODES),
+                            help='Режимы соединений через запятую: close, persistent, pool')
+        parser.add_argument('--path', default='/categories/', help='Адрес запроса')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Число запросов в каждом потоке')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Число потоков, одновременно выполняющих запросы')
+        parser.add_argument('--warmup', type=int, default=10,
+                            help='Запросов в каждом потоке до начала замера')
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+        parser.add_argument('--child', choices=MODES, help='Служебный: замер в текущем процессе')
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self.stdout.write(json.dumps(self.measure(options['child'], options)))
+            return
+        modes = [mode for mode in options['modes'].split(',') if mode]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f'Неизвестные режимы соединений: {", ".join(sorted(unknown))}')
+        # режим задаётся в settings через DB_CONN_MODE,
+        # поэтому каждый замер идёт в отдельном процессе
+        results = [self.run_child(mode, options) for mode in modes]
+        report = {
+            'params': {key: options[key] for key in ('path', 'requests', 'threads', 'warmup')},
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'host': settings.DATABASES['default']['HOST'],
+                'cpu_count': os.cpu_count(),
+            },
+            'results': results,
+        }
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as stream:
+                stream.write(data)
+        self.stdout.write(data)
+
+    def run_child(self, mode, options):
+        env = dict(os.environ, DB_CONN_MODE=mode,
+                   PYTHONPATH=os.pathsep.join([settings.BASE_DIR, os.environ.get('PYTHONPATH', '')]))
+        command = [sys.executable, '-m', 'django', 'bench_connections', '--child', mode]
+        for key in ('path', 'requests', 'threads', 'warmup'):
+            command += [f'--{key}', str(options[key])]
+        process = subprocess.run(command, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(f'Замер {mode} завершился с ошибкой:\n{process.stderr}')
+        return json.loads(process.stdout)
+
+    def measure(self, mode, options):
+        # ALLOWED_HOSTS для адреса testserver
+        setup_test_environment()
+        backend_pids = set()
+
+        def connected(sender, connection, **kwargs):
+            # разные pid серверного процесса - разные физические соединения
+            backend_pids.add(connection.connection.info.backend_pid)
+
+        connection_created.connect(connected)
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        # запросы проходят через WSGI-обработчик, как под сервером: в отличие
+        # от тестового клиента он закрывает соединения по сигналам запроса
+        handler = WSGIHandler()
+        factory = RequestFactory()
+
+        def worker():
+            timings = []
+            try:
+                for number in range(options['warmup'] + options['requests']):
+                    started = time.perf_counter()
+                    response = handler(factory.get(options['path']).environ,
+                                       lambda status, headers: None)
+                    response.close()
+                    elapsed = time.perf_counter() - started
+                    if response.status_code != 200:
+                        raise CommandError(f'{options["path"]}: ответ {response.status_code}')
+                    if number >= options['warmup']:
+                        timings.append(elapsed)
+            except Exception as exc:
+                errors.append(exc)
+            with lock:
+                latencies.extend(timings)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall_time = time.perf_counter() - started
+        if errors:
+            raise errors[0]
+        latencies.sort()
+        return {
+            'mode': mode,
+            'engine': settings.DATABASES['default']['ENGINE'],
+            'conn_max_age': settings.DATABASES['default']['CONN_MAX_AGE'],
+            'requests': len(latencies),
+            'wall_time': round(wall_time, 3),
+            'requests_per_sec': round(len(latencies) / wall_time, 1),
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies) * 1000, 3),
+                'p50': round(percentile(latencies, 0.5) * 1000, 3),
+                'p95': round(percentile(latencies, 0.95) * 1000, 3),
+                'p99': round(percentile(latencies, 0.99) * 1000, 3),
+                'max': round(latencies[-1] * 1000, 3),
+            },
+            'connections_opened': len(backend_pids),
+        }
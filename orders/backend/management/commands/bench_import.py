@@ -0,0 +1,199 @@
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from backend.models import User
+from backend.price_list import import_price_list
+from backend.views import ShopUpload
+
+# ид категорий синтетического прайса, чтобы не пересекаться с реальными
+CATEGORY_OFFSET = 900000
+
+COLORS = ('черный', 'белый', 'красный', 'синий', 'золотистый')
+
+
+def generate_price_list(path, goods, categories, parameters, repeat, seed=0):
+    """
+    Синтетический прайс-лист в формате data/shop1.yaml. Доля repeat товаров
+    повторяет название и модель одного из предыдущих товаров
+    """
+    rnd = random.Random(seed)
+    with open(path, 'w', encoding='utf8') as stream:
+        stream.write('shop: Тестовый магазин\ncategories:\n')
+        for number in range(categories):
+            stream.write(f'  - id: {CATEGORY_OFFSET + number}\n'
+                         f'    name: Категория {number}\n')
+        stream.write('\ngoods:\n')
+        for number in range(goods):
+            base = rnd.randrange(number) if number and rnd.random() < repeat else number
+            stream.write(f'  - id: {1000000 + number}\n'
+                         f'    category: {CATEGORY_OFFSET + base % categories}\n'
+                         f'    model: bench/model/{base}\n'
+                         f'    name: Товар {base}\n'
+                         f'    price: {rnd.randint(100, 100000)}\n'
+                         f'    price_rrc: {rnd.randint(100, 110000)}\n'
+                         f'    quantity: {rnd.randint(0, 50)}\n'
+                         f'    parameters:\n')
+            for parameter in range(parameters):
+                value = COLORS[rnd.randrange(len(COLORS))] if parameter % 2 else rnd.randint(1, 512)
+                stream.write(f'      "Параметр {parameter}": {value}\n')
+
+
+def reset_peak_rss():
+    # Linux 4.0+: пик RSS процесса (VmHWM) сбрасывается до текущего значения
+    try:
+        with open('/proc/self/clear_refs', 'w') as stream:
+            stream.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss():
+    # пик RSS процесса в килобайтах
+    try:
+        with open('/proc/self/status') as stream:
+            for line in stream:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss в килобайтах на Linux и в байтах на macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 if sys.platform == 'darwin' else rss
+
+
+def bench_path(path, price_list, options):
+    # каждый вариант импорта выполняется в новом процессе, max_rss_mb - пик RSS
+    # процесса за один импорт; память процессов разбора варианта parallel не входит
+    return Command().bench(path, price_list, options)
+
+
+class QueryCounter:
+    # обёртка execute_wrapper: число запросов и время в БД
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости импорта прайс-листов на синтетических данных (отчёт в JSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--goods', type=int, default=10000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--parameters', type=int, default=4,
+                            help='Параметров у каждого товара')
+        parser.add_argument('--repeat', type=float, default=0.1,
+                            help='Доля товаров с повторяющимся названием и моделью')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--paths', default='batched,parallel',
+                            help='Варианты импорта через запятую: batched, parallel')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Число процессов для варианта parallel')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Пиковая память Python через tracemalloc (замедляет импорт)')
+        parser.add_argument('--file', help='Готовый прайс-лист вместо синтетического')
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        paths = [path for path in options['paths'].split(',') if path]
+        unknown = set(paths) - {'batched', 'parallel'}
+        if unknown:
+            raise CommandError(f'Неизвестные варианты импорта: {", ".join(sorted(unknown))}')
+        if options['file'] is None and options['categories'] < 1:
+            raise CommandError('Нужна хотя бы одна категория')
+        with tempfile.TemporaryDirectory() as directory:
+            price_list = options['file']
+            if price_list is None:
+                price_list = os.path.join(directory, 'bench.yaml')
+                generate_price_list(price_list, options['goods'], options['categories'],
+                                    options['parameters'], options['repeat'], options['seed'])
+            results = []
+            context = multiprocessing.get_context('spawn')
+            bench_options = {key: options[key] for key in ('processes', 'trace_memory')}
+            for path in paths:
+                with ProcessPoolExecutor(1, mp_context=context, initializer=django.setup) as pool:
+                    results.extend(pool.submit(bench_path, path, price_list, bench_options).result())
+        report = {
+            'params': {key: options[key] for key in ('goods', 'categories', 'parameters',
+                                                      'repeat', 'seed', 'processes', 'file')},
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'cpu_count': os.cpu_count(),
+            },
+            'results': results,
+        }
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf8') as stream:
+                stream.write(data)
+        self.stdout.write(data)
+
+    def bench(self, path, price_list, options):
+        """
+        Первичный и повторный импорт одного файла. Всё выполняется в одной
+        транзакции, которая в конце откатывается, поэтому БД не меняется
+        """
+        results = []
+        with transaction.atomic():
+            seller = User.object.create_user(
+                email=f'bench-{time.time_ns()}@example.com', type='seller')
+            for run in ('first', 'reimport'):
+                results.append(self.measure(path, run, price_list, seller.id, options))
+            transaction.set_rollback(True)
+        return results
+
+    def measure(self, path, run, price_list, user, options):
+        counter = QueryCounter()
+        if options['trace_memory']:
+            tracemalloc.start()
+        # без сброса пика повторный импорт показал бы пик первого
+        rss_per_run = reset_peak_rss() or run == 'first'
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            if path == 'parallel':
+                stats = ShopUpload().handle_uploaded_file(
+                    price_list, user, processes=max(2, options['processes']))
+            else:
+                with open(price_list, 'rb') as stream:
+                    stats = import_price_list(stream, user).result()
+        wall_time = time.perf_counter() - started
+        result = {
+            'path': path,
+            'run': run,
+            'wall_time': round(wall_time, 3),
+            'rows_per_sec': round(sum(stats['shop_products'][key] for key in (
+                'inserted', 'updated', 'unchanged')) / wall_time, 1) if wall_time else None,
+            'queries': counter.count,
+            'db_time': round(counter.time, 3),
+            'max_rss_mb': round(peak_rss() / 1024, 1) if rss_per_run else None,
+            'stats': stats,
+        }
+        if options['trace_memory']:
+            result['peak_traced_mb'] = round(
+                tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            tracemalloc.stop()
+        return result
@@ -0,0 +1,98 @@
+import io
+import json
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.http import JsonResponse as DjangoJsonResponse
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from backend import renderers
+from backend.mixins import eager_loading_plan
+from backend.models import ShopProduct
+from backend.renderers import JsonResponse, ORJSONParser, ORJSONRenderer
+from backend.serializers import ShopProductSerializer
+
+
+def best_of(repeat, func):
+    # лучшее время из repeat запусков, мс
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(min(timings), 2)
+
+
+class Command(BaseCommand):
+    help = ('Сравнение стандартного JSON и orjson на ответе ShopProductSerializer: '
+            'время сериализации, рендеринга и разбора, отчёт в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Позиций магазинов в ответе')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов каждого замера')
+        parser.add_argument('--output', help='Файл для JSON-отчёта')
+
+    def handle(self, *args, **options):
+        if renderers.orjson is None:
+            raise CommandError('orjson не установлен, сравнивать не с чем')
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError('Число позиций и повторов должно быть положительным')
+        select, prefetch = eager_loading_plan(ShopProductSerializer)
+        rows = list(ShopProduct.objects.select_related(*select).prefetch_related(
+            *prefetch).order_by('id')[:options['rows']])
+        if not rows:
+            raise CommandError('Нет позиций магазинов, загрузите прайс-лист (bench_import)')
+        # если позиций в БД меньше, ответ набирается повторением
+        rows = (rows * (options['rows'] // len(rows) + 1))[:options['rows']]
+        repeat = options['repeat']
+
+        serialize_ms = best_of(repeat, lambda: ShopProductSerializer(rows, many=True).data)
+        data = {'results': ShopProductSerializer(rows, many=True).data}
+        context = {}
+        std_content = JSONRenderer().render(data, renderer_context=context)
+        fast_content = ORJSONRenderer().render(data, renderer_context=context)
+        if json.loads(std_content) != json.loads(fast_content):
+            raise CommandError('Ответы стандартного JSON и orjson различаются')
+
+        render = {
+            'json': best_of(repeat, lambda: JSONRenderer().render(data, renderer_context=context)),
+            'orjson': best_of(repeat, lambda: ORJSONRenderer().render(data, renderer_context=context)),
+        }
+        parse = {
+            'json': best_of(repeat, lambda: JSONParser().parse(io.BytesIO(std_content))),
+            'orjson': best_of(repeat, lambda: ORJSONParser().parse(io.BytesIO(std_content))),
+        }
+        plain = json.loads(std_content)
+        json_response = {
+            'json': best_of(repeat, lambda: DjangoJsonResponse(plain)),
+            'orjson': best_of(repeat, lambda: JsonResponse(plain)),
+        }
+        report = {
+            'params': {'rows': options['rows'], 'db_rows': len(set(row.id for row in rows)),
+                       'repeat': repeat, 'bytes': len(std_content)},
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'orjson': renderers.orjson.__version__,
+            },
+            'serialize_ms': serialize_ms,
+            'render_ms': render,
+            'parse_ms': parse,
+            'json_response_ms': json_response,
+            'saved': {
+                'render_ms': round(render['json'] - render['orjson'], 2),
+                # доля времени ответа (сериализация + рендеринг), сэкономленная orjson
+                'response_share': round((render['json'] - render['orjson'])
+                                        / (serialize_ms + render['json']), 3),
+                'render_speedup': round(render['json'] / render['orjson'], 1),
+                'parse_speedup': round(parse['json'] / parse['orjson'], 1),
+            },
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        self.stdout.write(output)
@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from backend.jobs import claim_jobs, fail_job, run_import_job
+
+
+def process_job(job_id, processes):
+    # как в конце HTTP-запроса: устаревшее соединение закрывается,
+    # в режиме пула соединение возвращается в пул между задачами
+    close_old_connections()
+    try:
+        return run_import_job(job_id, processes)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Обработка очереди импорта прайс-листов пулом процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                            help='Число процессов-обработчиков')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Период опроса очереди, сек.')
+        parser.add_argument('--parallel', type=int, default=1,
+                            help='Число процессов разбора товаров внутри одной задачи')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать текущую очередь и завершиться')
+
+    def handle(self, *args, **options):
+        processes = max(1, options['processes'])
+        # spawn: дочерние процессы не наследуют соединения с БД родителя
+        context = multiprocessing.get_context('spawn')
+        running = {}
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=django.setup) as pool:
+            while True:
+                close_old_connections()
+                claimed = claim_jobs(processes - len(running))
+                for job_id in claimed:
+                    running[pool.submit(
+                        process_job, job_id, options['parallel'])] = job_id
+                    self.stdout.write(f'Задача {job_id} запущена')
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                done, _ = wait(running, timeout=options['interval'],
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    if future.exception() is not None:
+                        fail_job(job_id, str(future.exception()))
+                        self.stderr.write(
+                            f'Задача {job_id}: {future.exception()}')
+                    else:
+                        self.stdout.write(
+                            f'Задача {job_id} завершена: {"успешно" if future.result() else "ошибка"}')
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from backend.notifications import flush_order_events
+from backend.outbox import Sender, send_pending
+
+
+class Command(BaseCommand):
+    help = ('Уведомления о заказах и отправка писем из очереди OutgoingEmail '
+            'через одно SMTP-соединение')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='Писем в пакете (по умолчанию EMAIL_OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Период опроса очереди, сек.')
+        parser.add_argument('--window', type=int,
+                            help='Окно объединения событий заказов, сек. '
+                                 '(по умолчанию ORDER_NOTIFY_WINDOW)')
+        parser.add_argument('--once', action='store_true',
+                            help='Отправить письма, время которых наступило, и завершиться')
+
+    def handle(self, *args, **options):
+        sender = Sender()
+        try:
+            while True:
+                close_old_connections()
+                # пакеты событий, пока остаются покупатели с наступившим временем уведомления
+                while flush_order_events(options['window']):
+                    pass
+                started = time.perf_counter()
+                sent, failed = send_pending(options['batch_size'], sender)
+                if sent or failed:
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f'Отправлено писем: {sent}, с ошибкой: {failed}, '
+                                      f'{sent / elapsed:.1f} писем/сек.')
+                    continue
+                # очередь пуста: соединение не держится открытым до следующего опроса
+                sender.close()
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            sender.close()
@@ -0,0 +1,145 @@
+"""
+Метрики API в памяти процесса и их вывод в текстовом формате Prometheus.
+Каждый процесс WSGI-сервера собирает и отдаёт свои значения.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from rest_framework.serializers import BaseSerializer
+
+# границы корзин гистограммы длительности запроса, сек.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+current_request = ContextVar('current_request_metrics', default=None)
+
+
+def label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestMetrics:
+    """
+    Метрики одного запроса: время, запросы к БД и время сериализации
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # используется как connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, duration):
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+                f'serializer;dur={self.serializer_time * 1000:.1f}, '
+                f'total;dur={duration * 1000:.1f}')
+
+
+class Registry:
+    """
+    Накопленные метрики по (метод, эндпоинт)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()
+        self.durations = defaultdict(float)
+        self.buckets = defaultdict(lambda: [0] * len(BUCKETS))
+        self.queries = Counter()
+        self.db_time = defaultdict(float)
+        self.serializer_time = defaultdict(float)
+
+    def observe(self, method, endpoint, status, metrics, duration):
+        key = (method, label(endpoint))
+        with self.lock:
+            self.requests[key + (str(status),)] += 1
+            self.durations[key] += duration
+            buckets = self.buckets[key]
+            for number, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    buckets[number] += 1
+            self.queries[key] += metrics.queries
+            self.db_time[key] += metrics.db_time
+            self.serializer_time[key] += metrics.serializer_time
+
+    def render(self):
+        lines = []
+        with self.lock:
+            lines += ['# HELP api_requests_total Число запросов',
+                      '# TYPE api_requests_total counter']
+            for (method, endpoint, status), value in sorted(self.requests.items()):
+                lines.append(
+                    f'api_requests_total{{method="{method}",endpoint="{endpoint}",status="{status}"}} {value}')
+            counts = Counter()
+            for (method, endpoint, status), value in self.requests.items():
+                counts[method, endpoint] += value
+            lines += ['# HELP api_request_duration_seconds Длительность запроса',
+                      '# TYPE api_request_duration_seconds histogram']
+            for (method, endpoint), buckets in sorted(self.buckets.items()):
+                labels = f'method="{method}",endpoint="{endpoint}"'
+                for bound, value in zip(BUCKETS, buckets):
+                    lines.append(
+                        f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {value}')
+                lines.append(
+                    f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} {counts[method, endpoint]}')
+                lines.append(
+                    f'api_request_duration_seconds_sum{{{labels}}} {self.durations[method, endpoint]:.6f}')
+                lines.append(
+                    f'api_request_duration_seconds_count{{{labels}}} {counts[method, endpoint]}')
+            for name, kind, help_text, values in (
+                    ('api_db_queries_total', 'counter', 'Число запросов к БД', self.queries),
+                    ('api_db_duration_seconds_total', 'counter', 'Время запросов к БД', self.db_time),
+                    ('api_serializer_duration_seconds_total', 'counter', 'Время сериализации',
+                     self.serializer_time)):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for (method, endpoint), value in sorted(values.items()):
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(
+                        f'{name}{{method="{method}",endpoint="{endpoint}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def install_serializer_timer():
+    """
+    Учёт времени BaseSerializer.data в метриках текущего запроса.
+    Вложенные сериализаторы вызывают to_representation, поэтому время
+    считается один раз на корневой сериализатор
+    """
+    data = BaseSerializer.data
+    if getattr(data.fget, 'timed', False):
+        return
+
+    def timed_data(serializer):
+        metrics = current_request.get()
+        if metrics is None:
+            return data.fget(serializer)
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+
+    timed_data.timed = True
+    BaseSerializer.data = property(timed_data)
@@ -0,0 +1,47 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from backend.metrics import RequestMetrics, current_request, install_serializer_timer, registry
+
+logger = logging.getLogger('backend.metrics')
+
+
+class MetricsMiddleware:
+    """
+    Время ответа, число и время запросов к БД и время сериализации.
+    Значения отдаются в заголовке Server-Timing и копятся для /metrics;
+    запросы сверх QUERY_BUDGET пишутся в лог с самыми частыми SQL
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budget = getattr(settings, 'QUERY_BUDGET', None)
+        install_serializer_timer()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        duration = metrics.duration
+        match = request.resolver_match
+        endpoint = (match.view_name or match.route) if match else 'unmatched'
+        registry.observe(request.method, endpoint,
+                         response.status_code, metrics, duration)
+        response['Server-Timing'] = metrics.server_timing(duration)
+        if self.budget is not None and metrics.queries > self.budget:
+            top = '\n'.join(f'{count} x {sql}' for sql,
+                            count in metrics.statements.most_common(5))
+            logger.warning('%s %s: %d запросов к БД (лимит %d), %.1f мс в БД\n%s',
+                           request.method, request.path, metrics.queries, self.budget,
+                           metrics.db_time * 1000, top)
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0002_import_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shopfiles',
+            name='checksum',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='SHA-256 файла'),
+        ),
+        migrations.AddField(
+            model_name='shopproduct',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=32, verbose_name='Хеш записи прайса'),
+        ),
+    ]
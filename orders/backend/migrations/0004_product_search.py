@@ -0,0 +1,42 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:14
+
+from django.conf import settings
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def fill_search_vector(apps, schema_editor):
+    # заполнение вектора для уже загруженных товаров
+    config = getattr(settings, 'SEARCH_CONFIG', 'russian')
+    Product = apps.get_model('backend', 'Product')
+    Product.objects.using(schema_editor.connection.alias).update(
+        search_vector=SearchVector('name', weight='A', config=config)
+        + SearchVector('model', weight='B', config=config))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_import_checksums'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['model'], name='product_model_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
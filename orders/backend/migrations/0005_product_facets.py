@@ -0,0 +1,86 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:18
+
+import math
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+import django.db.models.deletion
+
+
+def fill_facets(apps, schema_editor):
+    # числовые значения параметров и индекс фильтров для уже загруженных товаров
+    alias = schema_editor.connection.alias
+    ProductInf = apps.get_model('backend', 'ProductInf')
+    FacetValue = apps.get_model('backend', 'FacetValue')
+    batch = []
+    for product_inf in ProductInf.objects.using(alias).only('id', 'value').iterator():
+        try:
+            number = float(product_inf.value.strip().replace(',', '.'))
+        except ValueError:
+            continue
+        if math.isfinite(number):
+            product_inf.value_number = number
+            batch.append(product_inf)
+        if len(batch) >= 1000:
+            ProductInf.objects.using(alias).bulk_update(batch, ['value_number'])
+            batch = []
+    ProductInf.objects.using(alias).bulk_update(batch, ['value_number'])
+    rows = ProductInf.objects.using(alias).values(
+        'product__category_id', 'parameter_id', 'value').annotate(
+        count=Count('product_id', distinct=True), number=Min('value_number'))
+    FacetValue.objects.using(alias).bulk_create(
+        [FacetValue(category_id=row['product__category_id'], parameter_id=row['parameter_id'],
+                    value=row['value'], value_number=row['number'], count=row['count'])
+         for row in rows.iterator()],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_product_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetValue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.CharField(max_length=128, verbose_name='Значение')),
+                ('value_number', models.FloatField(null=True, verbose_name='Числовое значение')),
+                ('count', models.PositiveIntegerField(verbose_name='Число товаров')),
+            ],
+            options={
+                'verbose_name': 'Значение фильтра',
+                'verbose_name_plural': 'Индекс фильтров по параметрам',
+            },
+        ),
+        migrations.AddField(
+            model_name='productinf',
+            name='value_number',
+            field=models.FloatField(blank=True, null=True, verbose_name='Числовое значение'),
+        ),
+        migrations.AddIndex(
+            model_name='productinf',
+            index=models.Index(fields=['parameter', 'value'], name='product_inf_parameter_value'),
+        ),
+        migrations.AddIndex(
+            model_name='productinf',
+            index=models.Index(fields=['parameter', 'value_number'], name='product_inf_parameter_number'),
+        ),
+        migrations.AddField(
+            model_name='facetvalue',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='facet_values', to='backend.category', verbose_name='Категория'),
+        ),
+        migrations.AddField(
+            model_name='facetvalue',
+            name='parameter',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facet_values', to='backend.parameter', verbose_name='Параметр'),
+        ),
+        migrations.AddIndex(
+            model_name='facetvalue',
+            index=models.Index(fields=['category', 'parameter'], name='facet_category_parameter'),
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
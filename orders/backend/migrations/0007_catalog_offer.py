@@ -0,0 +1,72 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:21
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_offers(apps, schema_editor):
+    # витрина для уже загруженных позиций магазинов
+    alias = schema_editor.connection.alias
+    ShopProduct = apps.get_model('backend', 'ShopProduct')
+    ProductInf = apps.get_model('backend', 'ProductInf')
+    CatalogOffer = apps.get_model('backend', 'CatalogOffer')
+    ids = list(ShopProduct.objects.using(alias).order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), 1000):
+        shop_products = list(ShopProduct.objects.using(alias).filter(
+            id__in=ids[start:start + 1000]).select_related('shop', 'product__category'))
+        parameters = {}
+        for product_id, name, value in ProductInf.objects.using(alias).filter(
+                product_id__in={item.product_id for item in shop_products}).order_by(
+                'id').values_list('product_id', 'parameter__name', 'value'):
+            parameters.setdefault(product_id, {})[name] = value
+        CatalogOffer.objects.using(alias).bulk_create(
+            [CatalogOffer(shop_product_id=item.id, shop_id=item.shop_id, shop_name=item.shop.name,
+                          product_id=item.product_id, name=item.product.name,
+                          model=item.product.model, category_id=item.product.category_id,
+                          category_name=item.product.category.name if item.product.category else '',
+                          ext_id=item.ext_id, quantity=item.quantity, price=item.price,
+                          price_rrc=item.price_rrc, parameters=parameters.get(item.product_id, {}))
+             for item in shop_products])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_catalog_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogOffer',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shop_name', models.CharField(max_length=64, verbose_name='Название магазина')),
+                ('name', models.CharField(max_length=64, verbose_name='Название продукта')),
+                ('model', models.CharField(blank=True, max_length=64, verbose_name='Модель')),
+                ('category_name', models.CharField(blank=True, max_length=32, verbose_name='Название категории')),
+                ('ext_id', models.PositiveIntegerField(verbose_name='Внешний ИД')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('price', models.PositiveIntegerField(verbose_name='Цена')),
+                ('price_rrc', models.PositiveIntegerField(verbose_name='Рекомендованная розничная цена')),
+                ('parameters', models.JSONField(default=dict, verbose_name='Параметры')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='backend.category', verbose_name='Категория')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='backend.product', verbose_name='Товар')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offers', to='backend.shop', verbose_name='Магазин')),
+                ('shop_product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='offer', to='backend.shopproduct', verbose_name='Продукт в магазине')),
+            ],
+            options={
+                'verbose_name': 'Предложение магазина',
+                'verbose_name_plural': 'Витрина предложений магазинов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='catalogoffer',
+            index=models.Index(fields=['category', 'id'], name='offer_category_id'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogoffer',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['parameters'], name='offer_parameters_gin', opclasses=['jsonb_path_ops']),
+        ),
+        migrations.RunPython(fill_offers, migrations.RunPython.noop),
+    ]
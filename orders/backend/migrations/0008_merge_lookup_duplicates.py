@@ -0,0 +1,75 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:23
+
+from django.db import migrations
+from django.db.models import Count, Max, Min, Q
+
+
+def merge_duplicates(apps, schema_editor):
+    # перед уникальными индексами из 0009 дубли параметров сводятся к записи
+    # с меньшим id, её же выбирал импорт, а дубли значений параметров и позиций
+    # магазинов - к последней записи (с большим id): прежний импорт добавлял
+    # позицию при каждом изменении цены или остатка; ссылки на удаляемые
+    # записи переносятся, индекс фильтров затронутых категорий пересчитывается
+    alias = schema_editor.connection.alias
+    Parameter = apps.get_model('backend', 'Parameter')
+    Product = apps.get_model('backend', 'Product')
+    ProductInf = apps.get_model('backend', 'ProductInf')
+    FacetValue = apps.get_model('backend', 'FacetValue')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ShopProduct = apps.get_model('backend', 'ShopProduct')
+
+    def duplicates(model, *fields, keep=Min):
+        return model.objects.using(alias).values(*fields).annotate(
+            keep=keep('id'), count=Count('id')).filter(count__gt=1).order_by()
+
+    categories = set()
+    for row in duplicates(Parameter, 'name'):
+        extra = Parameter.objects.using(alias).filter(
+            name=row['name']).exclude(id=row['keep'])
+        categories.update(FacetValue.objects.using(alias).filter(
+            parameter__in=extra).values_list('category_id', flat=True))
+        ProductInf.objects.using(alias).filter(
+            parameter__in=extra).update(parameter_id=row['keep'])
+        FacetValue.objects.using(alias).filter(parameter__in=extra).delete()
+        extra.delete()
+    for row in duplicates(ProductInf, 'product_id', 'parameter_id', keep=Max):
+        extra = ProductInf.objects.using(alias).filter(
+            product_id=row['product_id'], parameter_id=row['parameter_id']).exclude(id=row['keep'])
+        OrderItem.objects.using(alias).filter(
+            product_info__in=extra).update(product_info_id=row['keep'])
+        extra.delete()
+        categories.update(Product.objects.using(alias).filter(
+            id=row['product_id']).values_list('category_id', flat=True))
+    for row in duplicates(ShopProduct, 'shop_id', 'ext_id', keep=Max):
+        ShopProduct.objects.using(alias).filter(
+            shop_id=row['shop_id'], ext_id=row['ext_id']).exclude(id=row['keep']).delete()
+
+    if not categories:
+        return
+    # то же, что refresh_facet_index, на исторических моделях
+    ids = [category_id for category_id in categories if category_id is not None]
+    affected = Q(category_id__in=ids)
+    products = Q(product__category_id__in=ids)
+    if None in categories:
+        affected |= Q(category__isnull=True)
+        products |= Q(product__category__isnull=True)
+    FacetValue.objects.using(alias).filter(affected).delete()
+    rows = ProductInf.objects.using(alias).filter(products).values(
+        'product__category_id', 'parameter_id', 'value').annotate(
+        count=Count('product_id', distinct=True), number=Min('value_number'))
+    FacetValue.objects.using(alias).bulk_create(
+        [FacetValue(category_id=row['product__category_id'], parameter_id=row['parameter_id'],
+                    value=row['value'], value_number=row['number'], count=row['count'])
+         for row in rows.iterator()],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0007_catalog_offer'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
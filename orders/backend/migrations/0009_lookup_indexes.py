@@ -0,0 +1,34 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_merge_lookup_duplicates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parameter',
+            name='name',
+            field=models.CharField(max_length=64, unique=True, verbose_name='Название'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'state'], name='order_user_state'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'model', 'category'], name='product_name_model_category'),
+        ),
+        migrations.AddConstraint(
+            model_name='productinf',
+            constraint=models.UniqueConstraint(fields=('product', 'parameter'), name='product_inf_product_parameter'),
+        ),
+        migrations.AddConstraint(
+            model_name='shopproduct',
+            constraint=models.UniqueConstraint(fields=('shop', 'ext_id'), name='shop_product_shop_ext_id'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:40
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_products(apps, schema_editor):
+    # перед уникальным ключом товара из 0011 дубли сводятся к записи с меньшим
+    # id; позиции магазинов, параметры и витрина переносятся на неё
+    alias = schema_editor.connection.alias
+    Product = apps.get_model('backend', 'Product')
+    ShopProduct = apps.get_model('backend', 'ShopProduct')
+    ProductInf = apps.get_model('backend', 'ProductInf')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    CatalogOffer = apps.get_model('backend', 'CatalogOffer')
+    FacetValue = apps.get_model('backend', 'FacetValue')
+
+    categories = set()
+    rows = Product.objects.using(alias).values('name', 'model', 'category_id').annotate(
+        keep=Min('id'), count=Count('id')).filter(count__gt=1).order_by()
+    for row in rows:
+        keep = row['keep']
+        extra = list(Product.objects.using(alias).filter(
+            name=row['name'], model=row['model'], category_id=row['category_id']).exclude(
+            id=keep).values_list('id', flat=True))
+        ShopProduct.objects.using(alias).filter(product_id__in=extra).update(product_id=keep)
+        CatalogOffer.objects.using(alias).filter(product_id__in=extra).update(product_id=keep)
+        kept = dict(ProductInf.objects.using(alias).filter(
+            product_id=keep).values_list('parameter_id', 'id'))
+        for product_inf in ProductInf.objects.using(alias).filter(product_id__in=extra).order_by('id'):
+            if product_inf.parameter_id in kept:
+                OrderItem.objects.using(alias).filter(product_info_id=product_inf.id).update(
+                    product_info_id=kept[product_inf.parameter_id])
+                product_inf.delete()
+            else:
+                product_inf.product_id = keep
+                product_inf.save(update_fields=['product'])
+                kept[product_inf.parameter_id] = product_inf.id
+        Product.objects.using(alias).filter(id__in=extra).delete()
+        categories.add(row['category_id'])
+
+    # счётчики фильтров по затронутым категориям
+    FacetValue.objects.using(alias).filter(category_id__in=categories).delete()
+    rows = ProductInf.objects.using(alias).filter(product__category_id__in=categories).values(
+        'product__category_id', 'parameter_id', 'value').annotate(
+        count=Count('product_id', distinct=True), number=Min('value_number'))
+    FacetValue.objects.using(alias).bulk_create(
+        [FacetValue(category_id=row['product__category_id'], parameter_id=row['parameter_id'],
+                    value=row['value'], value_number=row['number'], count=row['count'])
+         for row in rows.iterator()],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_products, migrations.RunPython.noop),
+    ]
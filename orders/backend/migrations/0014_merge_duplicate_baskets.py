@@ -0,0 +1,30 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:38
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_baskets(apps, schema_editor):
+    # у пользователя остаётся одна корзина с наименьшим id,
+    # позиции остальных корзин переносятся в неё
+    alias = schema_editor.connection.alias
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    rows = Order.objects.using(alias).filter(state='basket').values('user_id').annotate(
+        keep=Min('id'), count=Count('id')).filter(count__gt=1).order_by()
+    for row in rows:
+        extra = list(Order.objects.using(alias).filter(
+            user_id=row['user_id'], state='basket').exclude(id=row['keep']).values_list('id', flat=True))
+        OrderItem.objects.using(alias).filter(order_id__in=extra).update(order_id=row['keep'])
+        Order.objects.using(alias).filter(id__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_order_events'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_baskets, migrations.RunPython.noop),
+    ]
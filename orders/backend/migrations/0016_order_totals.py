@@ -0,0 +1,27 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0015_basket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Число позиций'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_sum',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Сумма заказа'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'total_sum'], name='order_user_total_sum'),
+        ),
+    ]
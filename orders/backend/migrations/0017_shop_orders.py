@@ -0,0 +1,44 @@
+# Generated by Django 4.1.7 on 2026-10-18 19:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_order_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopOrder',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('basket', 'В корзине'), ('new', 'Новый'), ('confirmed', 'Подтвержден'), ('assembled', 'Собран'), ('sent', 'Отправлен'), ('delivered', 'Доставлен'), ('canceled', 'Отменен')], default='new', max_length=16, verbose_name='Статус заказа')),
+                ('dt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата оформления')),
+                ('total_sum', models.PositiveBigIntegerField(default=0, verbose_name='Сумма заказа')),
+                ('items_count', models.PositiveIntegerField(default=0, verbose_name='Число позиций')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.order', verbose_name='Заказ')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shop_orders', to='backend.shop', verbose_name='Магазин')),
+            ],
+            options={
+                'verbose_name': 'Заказ магазина',
+                'verbose_name_plural': 'Список заказов магазинов',
+            },
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='shop_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='items', to='backend.shoporder', verbose_name='Заказ магазина'),
+        ),
+        migrations.AddIndex(
+            model_name='shoporder',
+            index=models.Index(fields=['shop', 'state', 'dt'], name='shop_order_shop_state_dt'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoporder',
+            constraint=models.UniqueConstraint(fields=('order', 'shop'), name='shop_order_order_shop'),
+        ),
+    ]
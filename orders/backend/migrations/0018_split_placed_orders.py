@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def split_orders(apps, schema_editor):
+    # заказы магазинов для заказов, оформленных до их появления. Цены на момент
+    # оформления не хранились, поэтому сумма по текущим ценам не считается:
+    # заказ одного магазина получает сумму заказа, если она была зафиксирована
+    # при оформлении, для нескольких магазинов сумма остаётся 0 (неизвестна)
+    alias = schema_editor.connection.alias
+    Order = apps.get_model('backend', 'Order')
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ShopOrder = apps.get_model('backend', 'ShopOrder')
+    for order in Order.objects.using(alias).exclude(state='basket').iterator():
+        shops = {}
+        for item in OrderItem.objects.using(alias).filter(
+                order_id=order.id, shop_product__isnull=False).select_related('shop_product'):
+            shops.setdefault(item.shop_product.shop_id, []).append(item)
+        total_sum = order.total_sum if len(shops) == 1 else 0
+        for shop_id, items in shops.items():
+            shop_order = ShopOrder.objects.using(alias).create(
+                order_id=order.id, shop_id=shop_id, state=order.state, dt=order.dt,
+                total_sum=total_sum, items_count=len(items))
+            OrderItem.objects.using(alias).filter(id__in=[item.id for item in items]).update(
+                shop_order_id=shop_order.id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_shop_orders'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_orders, migrations.RunPython.noop),
+    ]
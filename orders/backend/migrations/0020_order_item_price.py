@@ -0,0 +1,31 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:28
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_basket_prices(apps, schema_editor):
+    # в корзинах цена позиции - текущая цена в магазине; цены оформленных
+    # заказов не хранились, по текущим ценам они не восстанавливаются
+    alias = schema_editor.connection.alias
+    OrderItem = apps.get_model('backend', 'OrderItem')
+    ShopProduct = apps.get_model('backend', 'ShopProduct')
+    OrderItem.objects.using(alias).filter(order__state='basket').update(
+        price=Subquery(ShopProduct.objects.using(alias).filter(
+            id=OuterRef('shop_product_id')).values('price')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_import_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='price',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Цена'),
+        ),
+        migrations.RunPython(fill_basket_prices, migrations.RunPython.noop),
+    ]
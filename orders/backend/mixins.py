@@ -0,0 +1,67 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+def eager_loading(serializer, prefix=''):
+    """
+    План загрузки связей для дерева сериализатора: список путей для
+    select_related и объекты Prefetch для prefetch_related.
+    Связи "к одному" присоединяются в тот же запрос, связи "ко многим"
+    загружаются отдельным запросом со своим планом
+    """
+    model = serializer.Meta.model
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        if isinstance(field, ListSerializer):
+            child = field.child
+        elif isinstance(field, ManyRelatedField):
+            child = field.child_relation
+        elif isinstance(field, (BaseSerializer, RelatedField)):
+            child = field
+        else:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+        path = prefix + field.source
+        if model_field.many_to_many or model_field.one_to_many:
+            queryset = model_field.related_model._default_manager.all()
+            if isinstance(child, BaseSerializer):
+                child_select, child_prefetch = eager_loading(child)
+                queryset = queryset.select_related(
+                    *child_select).prefetch_related(*child_prefetch)
+            prefetch.append(Prefetch(path, queryset=queryset))
+        elif isinstance(child, BaseSerializer):
+            select.append(path)
+            child_select, child_prefetch = eager_loading(child, path + '__')
+            select += child_select
+            prefetch += child_prefetch
+        elif not isinstance(child, PrimaryKeyRelatedField):
+            # для первичного ключа достаточно поля <name>_id
+            select.append(path)
+    return select, prefetch
+
+
+@lru_cache(maxsize=None)
+def eager_loading_plan(serializer_class):
+    return eager_loading(serializer_class())
+
+
+class EagerLoadingMixin:
+    """
+    Добавляет к queryset вьюсета select_related/prefetch_related по дереву
+    его сериализатора, чтобы список отдавался за постоянное число запросов
+    """
+
+    def get_queryset(self):
+        select, prefetch = eager_loading_plan(self.get_serializer_class())
+        return super().get_queryset().select_related(*select).prefetch_related(*prefetch)
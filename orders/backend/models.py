@@ -1,6 +1,9 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.validators import UnicodeUsernameValidator
 import django_rest_passwordreset.tokens
@@ -20,6 +23,20 @@ STATE_CHOICES = (
     ('canceled', 'Отменен'),
 )
 
+JOB_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('running', 'Выполняется'),
+    ('done', 'Завершен'),
+    ('failed', 'Ошибка'),
+)
+
+EMAIL_STATE_CHOICES = (
+    ('queued', 'В очереди'),
+    ('sending', 'Отправляется'),
+    ('sent', 'Отправлено'),
+    ('failed', 'Ошибка'),
+)
+
 
 class CustomUser(BaseUserManager):
     use_in_migrations = True
@@ -124,11 +141,22 @@ class Product(models.Model):
     model = models.CharField(max_length=64, verbose_name='Модель', blank=True)
     category = models.ForeignKey(Category, verbose_name='Категория', related_name='products', blank=True,
                                  null=True, on_delete=models.CASCADE)
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         verbose_name = 'Продукт'
         verbose_name_plural = "Список продуктов"
         ordering = ('-name',)
+        constraints = [
+            # ключ товара при импорте
+            models.UniqueConstraint(fields=['name', 'model', 'category'],
+                                    name='product_natural_key'),
+        ]
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            GinIndex(fields=['model'], name='product_model_trgm',
+                     opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return self.name
@@ -144,14 +172,21 @@ class ShopProduct(models.Model):
     price = models.PositiveIntegerField(verbose_name='Цена')
     price_rrc = models.PositiveIntegerField(
         verbose_name='Рекомендованная розничная цена')
+    content_hash = models.CharField(
+        verbose_name='Хеш записи прайса', max_length=32, blank=True, default='')
 
     class Meta:
         verbose_name = 'Продукт в магазине'
         verbose_name_plural = 'Список продуктов в магазине'
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'ext_id'],
+                                    name='shop_product_shop_ext_id'),
+        ]
 
 
 class Parameter(models.Model):
-    name = models.CharField(max_length=64, verbose_name='Название')
+    name = models.CharField(
+        max_length=64, verbose_name='Название', unique=True)
 
     class Meta:
         verbose_name = 'Название парамметра'
@@ -169,10 +204,85 @@ class ProductInf(models.Model):
                                   on_delete=models.CASCADE)
     value = models.CharField(
         max_length=128, blank=True, verbose_name='Значение')
+    value_number = models.FloatField(
+        verbose_name='Числовое значение', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Информация о продукте'
         verbose_name_plural = 'Список информации о продуктах'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'parameter'],
+                                    name='product_inf_product_parameter'),
+        ]
+        indexes = [
+            models.Index(fields=['parameter', 'value'],
+                         name='product_inf_parameter_value'),
+            models.Index(fields=['parameter', 'value_number'],
+                         name='product_inf_parameter_number'),
+        ]
+
+
+class FacetValue(models.Model):
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='facet_values',
+                                 null=True, on_delete=models.CASCADE)
+    parameter = models.ForeignKey(Parameter, verbose_name='Параметр', related_name='facet_values',
+                                  on_delete=models.CASCADE)
+    value = models.CharField(max_length=128, verbose_name='Значение')
+    value_number = models.FloatField(
+        verbose_name='Числовое значение', null=True)
+    count = models.PositiveIntegerField(verbose_name='Число товаров')
+
+    class Meta:
+        verbose_name = 'Значение фильтра'
+        verbose_name_plural = 'Индекс фильтров по параметрам'
+        indexes = [
+            models.Index(fields=['category', 'parameter'],
+                         name='facet_category_parameter'),
+        ]
+
+
+class CatalogOffer(models.Model):
+    shop_product = models.OneToOneField(ShopProduct, verbose_name='Продукт в магазине', related_name='offer',
+                                        on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='offers',
+                             on_delete=models.CASCADE)
+    shop_name = models.CharField(
+        max_length=64, verbose_name='Название магазина')
+    product = models.ForeignKey(Product, verbose_name='Товар', related_name='offers',
+                                on_delete=models.CASCADE)
+    name = models.CharField(max_length=64, verbose_name='Название продукта')
+    model = models.CharField(max_length=64, verbose_name='Модель', blank=True)
+    category = models.ForeignKey(Category, verbose_name='Категория', related_name='offers', null=True,
+                                 on_delete=models.CASCADE)
+    category_name = models.CharField(
+        max_length=32, verbose_name='Название категории', blank=True)
+    ext_id = models.PositiveIntegerField(verbose_name='Внешний ИД')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    price = models.PositiveIntegerField(verbose_name='Цена')
+    price_rrc = models.PositiveIntegerField(
+        verbose_name='Рекомендованная розничная цена')
+    parameters = models.JSONField(verbose_name='Параметры', default=dict)
+
+    class Meta:
+        verbose_name = 'Предложение магазина'
+        verbose_name_plural = 'Витрина предложений магазинов'
+        indexes = [
+            models.Index(fields=['category', 'id'],
+                         name='offer_category_id'),
+            GinIndex(fields=['parameters'], name='offer_parameters_gin',
+                     opclasses=['jsonb_path_ops']),
+        ]
+
+
+class CatalogVersion(models.Model):
+    name = models.CharField(
+        max_length=32, primary_key=True, verbose_name='Ресурс API')
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия', default=0)
+
+    class Meta:
+        verbose_name = 'Версия данных каталога'
+        verbose_name_plural = 'Версии данных каталога'
 
 
 class Contact(models.Model):
@@ -203,31 +313,143 @@ class Order(models.Model):
                              choices=STATE_CHOICES, max_length=16)
     user_contact = models.ForeignKey(Contact, verbose_name='Контакты', blank=True, null=True,
                                      on_delete=models.CASCADE)
+    # пересчитываются при изменении позиций корзины (backend.basket.update_totals)
+    # и фиксируются при оформлении
+    total_sum = models.PositiveBigIntegerField(verbose_name='Сумма заказа', default=0)
+    items_count = models.PositiveIntegerField(verbose_name='Число позиций', default=0)
 
     class Meta:
         verbose_name = 'Заказ'
         verbose_name_plural = 'Список заказов'
         ordering = ('-dt',)
+        indexes = [
+            models.Index(fields=['user', 'state'], name='order_user_state'),
+            models.Index(fields=['user', 'total_sum'], name='order_user_total_sum'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user'], condition=models.Q(state='basket'),
+                                    name='order_one_basket'),
+        ]
 
     def __str__(self):
         return str(self.dt)
 
 
+class ShopOrder(models.Model):
+    # часть оформленного заказа с позициями одного магазина,
+    # создаётся при оформлении; по ней магазины получают свои заказы
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='shop_orders',
+                              on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, verbose_name='Магазин', related_name='shop_orders',
+                             on_delete=models.CASCADE)
+    state = models.CharField(verbose_name='Статус заказа',
+                             choices=STATE_CHOICES, max_length=16, default='new')
+    dt = models.DateTimeField(verbose_name='Дата оформления', default=timezone.now)
+    total_sum = models.PositiveBigIntegerField(verbose_name='Сумма заказа', default=0)
+    items_count = models.PositiveIntegerField(verbose_name='Число позиций', default=0)
+
+    class Meta:
+        verbose_name = 'Заказ магазина'
+        verbose_name_plural = 'Список заказов магазинов'
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'shop'], name='shop_order_order_shop'),
+        ]
+        indexes = [
+            models.Index(fields=['shop', 'state', 'dt'], name='shop_order_shop_state_dt'),
+        ]
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, verbose_name='Заказ', related_name='ordered_items', blank=True,
                               on_delete=models.CASCADE)
+    shop_order = models.ForeignKey(ShopOrder, verbose_name='Заказ магазина', related_name='items',
+                                   blank=True, null=True, on_delete=models.SET_NULL)
     product_info = models.ForeignKey(ProductInf, verbose_name='Информация о продукте', related_name='ordered_items',
-                                     blank=True, on_delete=models.CASCADE)
+                                     blank=True, null=True, on_delete=models.CASCADE)
+    # позиция магазина; при удалении позиции из прайса заказ сохраняется
+    shop_product = models.ForeignKey(ShopProduct, verbose_name='Позиция магазина', related_name='ordered_items',
+                                     blank=True, null=True, on_delete=models.SET_NULL)
     quantity = models.PositiveIntegerField(verbose_name='Количество')
+    # цена за единицу: в корзине - текущая цена позиции, при оформлении фиксируется;
+    # у заказов, оформленных до появления поля, неизвестна
+    price = models.PositiveIntegerField(verbose_name='Цена', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Заказанная позиция'
         verbose_name_plural = 'Список заказанных позиций'
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'shop_product'],
+                                    name='order_item_order_shop_product'),
+        ]
 
 
 class ShopFiles(models.Model):
     file = models.FileField(null=True, upload_to='uploaded_data')
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, null=True)
+    checksum = models.CharField(
+        verbose_name='SHA-256 файла', max_length=64, blank=True, db_index=True)
+
+
+class ImportJob(models.Model):
+    user = models.ForeignKey(User, verbose_name='Продавец', related_name='import_jobs',
+                             on_delete=models.CASCADE)
+    file = models.OneToOneField(ShopFiles, verbose_name='Файл', related_name='job',
+                                on_delete=models.CASCADE)
+    state = models.CharField(verbose_name='Статус', choices=JOB_STATE_CHOICES,
+                             max_length=16, default='queued', db_index=True)
+    progress = models.PositiveSmallIntegerField(
+        verbose_name='Прогресс, %', default=0)
+    stats = models.JSONField(verbose_name='Статистика', default=dict, blank=True)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # обработчик периодически обновляет heartbeat_at, задачу без отметки
+    # дольше IMPORT_JOB_TIMEOUT считают брошенной
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток выполнения', default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Задача импорта'
+        verbose_name_plural = 'Список задач импорта'
+        ordering = ('created_at',)
+
+
+class OutgoingEmail(models.Model):
+    subject = models.CharField(verbose_name='Тема', max_length=255)
+    body = models.TextField(verbose_name='Текст')
+    from_email = models.CharField(verbose_name='Отправитель', max_length=254)
+    to = models.JSONField(verbose_name='Получатели', default=list)
+    state = models.CharField(verbose_name='Статус', choices=EMAIL_STATE_CHOICES,
+                             max_length=16, default='queued')
+    attempts = models.PositiveSmallIntegerField(verbose_name='Попыток отправки', default=0)
+    next_attempt_at = models.DateTimeField(verbose_name='Следующая попытка', default=timezone.now)
+    error = models.TextField(verbose_name='Ошибка', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Исходящее письмо'
+        verbose_name_plural = 'Очередь исходящих писем'
+        ordering = ('next_attempt_at',)
+        indexes = [
+            models.Index(fields=['state', 'next_attempt_at'], name='email_state_next_attempt'),
+            models.Index(fields=['sent_at'], name='email_sent_at'),
+        ]
+
+
+class OrderEvent(models.Model):
+    # изменение статуса заказа, ожидающее уведомления покупателя
+    user = models.ForeignKey(User, verbose_name='Покупатель', related_name='order_events',
+                             on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, verbose_name='Заказ', related_name='events',
+                              on_delete=models.CASCADE)
+    state = models.CharField(verbose_name='Статус заказа', choices=STATE_CHOICES, max_length=16)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'Событие заказа'
+        verbose_name_plural = 'Очередь уведомлений о заказах'
 
 
 class ConfirmEmailToken(models.Model):
@@ -0,0 +1,97 @@
+"""
+Уведомления покупателей об изменении статуса заказов.
+
+Событие статуса сохраняется в OrderEvent без обращения к пользователю.
+Команда `manage.py send_emails` периодически собирает события
+покупателей, у которых самое старое событие ждёт дольше
+ORDER_NOTIFY_WINDOW секунд, и ставит в очередь писем одно письмо на
+покупателя со всеми его заказами: пользователи загружаются одним
+запросом, шаблоны компилируются один раз на пакет, письма
+записываются одним INSERT.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.template.loader import get_template
+from django.utils import timezone
+
+from backend.models import OrderEvent, OutgoingEmail, STATE_CHOICES, User
+
+BATCH_SIZE = 500
+
+STATES = dict(STATE_CHOICES)
+
+
+def enqueue_order_events(events):
+    """
+    Постановка событий (user_id, order_id, state) в очередь уведомлений
+    """
+    OrderEvent.objects.bulk_create(
+        [OrderEvent(user_id=user_id, order_id=order_id, state=state)
+         for user_id, order_id, state in events],
+        batch_size=BATCH_SIZE)
+
+
+def flush_order_events(window=None, batch_size=BATCH_SIZE):
+    """
+    Письма по накопившимся событиям для не более чем batch_size
+    покупателей. Возвращает число обработанных событий: писем может
+    не быть, если у покупателей нет адреса
+    """
+    window = settings.ORDER_NOTIFY_WINDOW if window is None else window
+    cutoff = timezone.now() - timedelta(seconds=window)
+    with transaction.atomic():
+        user_ids = list(OrderEvent.objects.values('user_id').annotate(
+            first=Min('created_at')).filter(first__lte=cutoff).order_by(
+            'first').values_list('user_id', flat=True)[:batch_size])
+        if not user_ids:
+            return 0
+        # события, которые забрал параллельный отправитель, пропускаются
+        events = list(OrderEvent.objects.select_for_update(skip_locked=True).filter(
+            user_id__in=user_ids).order_by('id').values_list('id', 'user_id', 'order_id', 'state'))
+        # по каждому заказу важен только последний статус
+        orders = {}
+        for _, user_id, order_id, state in events:
+            orders.setdefault(user_id, {})[order_id] = state
+        users = User.objects.only('id', 'email').in_bulk(list(orders))
+        subject_template = get_template('backend/email/order_status_subject.txt')
+        body_template = get_template('backend/email/order_status.txt')
+        emails = []
+        for user_id, states in orders.items():
+            user = users.get(user_id)
+            if user is None or not user.email:
+                continue
+            context = {'user': user, 'orders': [
+                {'id': order_id, 'state': state, 'state_display': STATES.get(state, state)}
+                for order_id, state in sorted(states.items())]}
+            emails.append(OutgoingEmail(subject=subject_template.render(context).strip(),
+                                        body=body_template.render(context),
+                                        from_email=settings.EMAIL_HOST_USER, to=[user.email]))
+        OutgoingEmail.objects.bulk_create(emails, batch_size=BATCH_SIZE)
+        OrderEvent.objects.filter(id__in=[event[0] for event in events]).delete()
+    return len(events)
+
+
+def queue_metrics():
+    """
+    Глубина очередей и скорость отправки писем в формате Prometheus.
+    Письма отправляет отдельный процесс, поэтому значения берутся из БД
+    """
+    minute_ago = timezone.now() - timedelta(minutes=1)
+    sent = OutgoingEmail.objects.filter(sent_at__gte=minute_ago).count()
+    metrics = (
+        ('email_outbox_queued', 'Писем в очереди на отправку',
+         OutgoingEmail.objects.filter(state__in=('queued', 'sending')).count()),
+        ('email_outbox_failed', 'Писем, не отправленных после всех попыток',
+         OutgoingEmail.objects.filter(state='failed').count()),
+        ('order_events_pending', 'Событий заказов, ожидающих уведомления',
+         OrderEvent.objects.count()),
+        ('email_sent_per_second', 'Отправлено писем в секунду за последнюю минуту',
+         round(sent / 60, 3)),
+    )
+    lines = []
+    for name, help_text, value in metrics:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,139 @@
+"""
+Очередь исходящих писем.
+
+Письма не отправляются внутри запроса: enqueue_email сохраняет письмо в
+OutgoingEmail в текущей транзакции, поэтому письмо уходит только если
+транзакция зафиксирована. Команда `manage.py send_emails` забирает
+письма пакетами и отправляет их через одно SMTP-соединение, открытое,
+пока в очереди есть письма. Пакет помечается отправляемым короткой
+транзакцией, письма отправляются вне транзакции, и статусы пакета
+записываются одним запросом: медленный почтовый сервер не держит
+блокировки строк. Письма отправителя, остановленного посреди пакета,
+забираются снова через EMAIL_OUTBOX_SEND_TIMEOUT секунд.
+Письмо, которое не удалось отправить, повторяется с экспоненциально
+растущей паузой, после EMAIL_OUTBOX_MAX_ATTEMPTS попыток помечается
+ошибкой.
+"""
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from backend.models import OutgoingEmail
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    return OutgoingEmail.objects.create(
+        subject=subject, body=body, to=list(to),
+        from_email=from_email or settings.EMAIL_HOST_USER)
+
+
+def retry_delay(attempts):
+    # пауза перед следующей попыткой: 1, 2, 4, ... базовых интервала
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+class Sender:
+    """
+    SMTP-соединение, общее для нескольких пакетов писем. После ошибки
+    соединения оно закрывается и открывается заново следующим письмом
+    """
+
+    def __init__(self):
+        self.connection = None
+
+    def send(self, email):
+        if self.connection is None:
+            connection = get_connection()
+            connection.open()
+            self.connection = connection
+        message = EmailMultiAlternatives(email.subject, email.body, email.from_email,
+                                         email.to, connection=self.connection)
+        try:
+            message.send()
+        except Exception as exc:
+            if not is_message_error(exc):
+                self.close()
+            raise
+
+    def close(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+
+
+def claim_emails(batch_size):
+    # пакет писем, время отправки которых наступило, помечается отправляемым;
+    # параллельные отправители пропускают заблокированные строки
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+            state__in=('queued', 'sending'), next_attempt_at__lte=now).order_by(
+            'next_attempt_at')[:batch_size])
+        OutgoingEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            state='sending', next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_SEND_TIMEOUT))
+    return emails
+
+
+def send_pending(batch_size=None, sender=None):
+    """
+    Отправка одного пакета писем, время отправки которых наступило.
+    Без sender соединение открывается на один пакет. Возвращает
+    (отправлено, с ошибкой)
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    own_sender = sender is None
+    sender = sender or Sender()
+    sent = []
+    failed = []
+    emails = claim_emails(batch_size)
+    try:
+        for number, email in enumerate(emails):
+            try:
+                sender.send(email)
+            except Exception as exc:
+                reschedule(email, exc)
+                failed.append(email)
+                if not is_message_error(exc):
+                    # почтовый сервер недоступен: остаток пакета повторяется позже
+                    for pending in emails[number + 1:]:
+                        reschedule(pending, exc)
+                        failed.append(pending)
+                    break
+            else:
+                email.state = 'sent'
+                email.attempts += 1
+                email.sent_at = timezone.now()
+                email.error = ''
+                sent.append(email)
+    finally:
+        # статусы уже отправленных писем записываются и при сбое посреди пакета
+        OutgoingEmail.objects.bulk_update(
+            sent + failed, ['state', 'attempts', 'sent_at', 'error', 'next_attempt_at'])
+        if own_sender:
+            sender.close()
+    return len(sent), len(failed)
+
+
+def is_message_error(exc):
+    # отказ сервера принять конкретное письмо, а не ошибка соединения
+    return isinstance(exc, (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused,
+                            smtplib.SMTPDataError))
+
+
+def reschedule(email, exc):
+    email.attempts += 1
+    email.error = f'{exc.__class__.__name__}: {exc}'
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.state = 'failed'
+    else:
+        email.state = 'queued'
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
@@ -0,0 +1,30 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CatalogCursorPagination(CursorPagination):
+    """
+    Постраничный вывод по курсору: следующая страница выбирается условием
+    id > последнего id (без OFFSET), поэтому время ответа не зависит от
+    номера страницы
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        # результаты поиска идут по убыванию релевантности
+        if 'search_rank' in queryset.query.annotations:
+            return ('-search_rank', 'id')
+        return super().get_ordering(request, queryset, view)
+
+
+class ShopOrderCursorPagination(CursorPagination):
+    """
+    Заказы магазина от новых к старым: страница - диапазон индекса
+    (магазин, статус, дата оформления) после даты последнего заказа
+    """
+    ordering = '-dt'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
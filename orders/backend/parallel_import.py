@@ -0,0 +1,153 @@
+"""
+Параллельный импорт больших прайс-листов.
+
+Раздел `goods` делится по строкам на части по shard_size товаров, каждую
+часть разбирает и нормализует отдельный процесс. Основной процесс один раз
+создаёт магазин и категории, а затем пишет готовые части в БД по порядку,
+так что get_or_create из разных процессов не конкурируют между собой.
+Раздел goods в другой записи (flow-стиль `goods: [...]`) по строкам не
+делится, такой файл разбирается целиком в основном процессе.
+"""
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+import yaml
+from django.db import transaction
+
+from backend.importer import BATCH_SIZE, CatalogImporter, CatalogImportError, chunks, normalize_goods
+from backend.models import Shop
+from backend.response_cache import invalidate_catalog
+from backend.price_list import Loader, abort_import
+
+GOODS_RE = re.compile(r'^goods\s*:\s*(#.*)?$')
+
+
+def split_goods(lines, head, shard_size=BATCH_SIZE):
+    """
+    Генератор текстов частей раздела goods по shard_size товаров.
+    Остальные строки документа добавляются в список head, туда же попадает
+    раздел goods, если он записан не блочным списком.
+    Части разбираются независимо, поэтому якоря между товарами не поддерживаются
+    """
+    shard, count, indent, in_goods, split = [], 0, None, False, True
+    for line in lines:
+        if not in_goods:
+            if split and GOODS_RE.match(line):
+                in_goods, goods_line = True, line
+            else:
+                head.append(line)
+            continue
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            shard.append(line)
+            continue
+        line_indent = len(line) - len(line.lstrip(' '))
+        if indent is None:
+            if not stripped.startswith('-'):
+                # flow-стиль или пустой раздел: goods остаётся в head
+                head.extend([goods_line, *shard, line])
+                shard, in_goods, split = [], False, False
+                continue
+            indent = line_indent
+        if line_indent < indent or (line_indent == indent and not stripped.startswith('-')):
+            # раздел goods закончился
+            in_goods = False
+            head.append(line)
+            continue
+        if line_indent == indent:
+            if count == shard_size:
+                yield ''.join(shard)
+                shard, count = [], 0
+            count += 1
+        shard.append(line)
+    if count:
+        yield ''.join(shard)
+    elif in_goods:
+        # пустой раздел goods в конце файла
+        head.extend([goods_line, *shard])
+
+
+def parse_goods_shard(text):
+    # выполняется в дочернем процессе
+    try:
+        items = yaml.load(text, Loader=Loader) or []
+    except yaml.YAMLError as exc:
+        # ошибки PyYAML теряют текст при передаче между процессами
+        raise CatalogImportError(str(exc)) from None
+    return [normalize_goods(item) for item in items]
+
+
+def start_import(head, user, batch_size):
+    # возвращает импортёр и разобранную часть документа без частей goods
+    data = yaml.load(''.join(head), Loader=Loader) or {}
+    if not isinstance(data, dict) or 'shop' not in data:
+        raise CatalogImportError(
+            'Название магазина должно быть указано в начале файла')
+    with transaction.atomic():
+        shop, _ = Shop.objects.update_or_create(
+            seller_id=user, defaults={'name': data['shop']})
+        importer = CatalogImporter(shop, batch_size)
+        for categories in chunks(data.get('categories') or [], batch_size):
+            importer.import_categories(categories)
+        invalidate_catalog(importer.take_changes())
+    return importer, data
+
+
+def import_price_list_parallel(stream, user, processes=None, shard_size=BATCH_SIZE, on_batch=None):
+    """
+    Параллельный вариант import_price_list: разбор и нормализация товаров
+    выполняются в processes процессах, запись в БД - в текущем.
+    Магазин и категории должны идти в файле перед разделом goods
+    """
+    processes = processes or os.cpu_count() or 1
+    # число частей в обработке ограничено, чтобы не держать файл в памяти
+    limit = 2 * processes
+    head = []
+    importer = None
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=django.setup) as pool:
+            pending = deque()
+            try:
+                for text in split_goods(stream, head, shard_size):
+                    if importer is None:
+                        importer, _ = start_import(head, user, shard_size)
+                    pending.append(pool.submit(parse_goods_shard, text))
+                    while len(pending) >= limit or (pending and pending[0].done()):
+                        write_shard(importer, pending.popleft().result(), on_batch)
+                while pending:
+                    write_shard(importer, pending.popleft().result(), on_batch)
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        if importer is None:
+            # блочного списка goods нет, раздел разобран вместе с документом
+            importer, data = start_import(head, user, shard_size)
+            if 'goods' in data:
+                goods = data['goods'] or []
+                if not isinstance(goods, list):
+                    raise CatalogImportError('Раздел goods должен быть списком')
+                for batch in list(chunks(goods, shard_size)) or [[]]:
+                    write_shard(importer, [normalize_goods(item) for item in batch], on_batch)
+        with transaction.atomic():
+            importer.finish()
+            invalidate_catalog(importer.take_changes())
+    except Exception:
+        if importer is not None:
+            abort_import(importer)
+        raise
+    return importer
+
+
+def write_shard(importer, goods, on_batch):
+    with transaction.atomic():
+        importer.prepare_parameters(
+            {name for item in goods for name in item['parameters']})
+        importer.import_normalized(goods)
+        invalidate_catalog(importer.take_changes())
+    if on_batch is not None:
+        on_batch(importer)
@@ -0,0 +1,175 @@
+"""
+Потоковое чтение прайс-листа поставщика.
+
+Документ не загружается целиком: парсер идёт по событиям YAML и собирает
+объекты только для отдельных записей `categories` и `goods`, поэтому
+потребление памяти не зависит от размера файла.
+"""
+import yaml
+from django.db import transaction
+from yaml.events import (AliasEvent, ScalarEvent, SequenceStartEvent, SequenceEndEvent,
+                         MappingStartEvent, MappingEndEvent, StreamEndEvent)
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+
+from backend.importer import BATCH_SIZE, CatalogImporter, CatalogImportError
+from backend.models import Shop
+from backend.response_cache import invalidate_catalog
+
+# C-загрузчик libyaml заметно быстрее, если PyYAML собран с ним
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+SECTIONS = ('categories', 'goods')
+
+# значение для пустого раздела, чтобы его присутствие в файле было видно
+EMPTY = object()
+
+
+def _compose(loader, anchors):
+    # сборка узла из событий; compose_node недоступен у C-загрузчика
+    event = loader.get_event()
+    if isinstance(event, AliasEvent):
+        if event.anchor not in anchors:
+            raise yaml.composer.ComposerError(
+                None, None, f'found undefined alias {event.anchor}', event.start_mark)
+        return anchors[event.anchor]
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(tag, event.value, event.start_mark,
+                          event.end_mark, style=event.style)
+    elif isinstance(event, SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(SequenceNode, None, event.implicit)
+        node = SequenceNode(tag, [], event.start_mark, None,
+                            flow_style=event.flow_style)
+        while not loader.check_event(SequenceEndEvent):
+            node.value.append(_compose(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    elif isinstance(event, MappingStartEvent):
+        tag = event.tag
+        if tag is None or tag == '!':
+            tag = loader.resolve(MappingNode, None, event.implicit)
+        node = MappingNode(tag, [], event.start_mark, None,
+                           flow_style=event.flow_style)
+        while not loader.check_event(MappingEndEvent):
+            key = _compose(loader, anchors)
+            node.value.append((key, _compose(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+    else:
+        raise yaml.composer.ComposerError(
+            None, None, f'unexpected event {event}', event.start_mark)
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+def iter_price_list(stream):
+    """
+    Генератор пар (раздел, значение): ('shop', название), затем по одной
+    записи ('categories', {...}) и ('goods', {...}) в порядке следования в файле;
+    для пустого раздела отдаётся (раздел, EMPTY)
+    """
+    loader = Loader(stream)
+    anchors = {}
+    try:
+        loader.get_event()  # StreamStart
+        if loader.check_event(StreamEndEvent):
+            return
+        loader.get_event()  # DocumentStart
+        if not loader.check_event(MappingStartEvent):
+            raise yaml.constructor.ConstructorError(
+                None, None, 'прайс-лист должен быть словарём', loader.peek_event().start_mark)
+        loader.get_event()
+        while not loader.check_event(MappingEndEvent):
+            key = loader.construct_document(_compose(loader, anchors))
+            if key in SECTIONS and loader.check_event(SequenceStartEvent):
+                loader.get_event()
+                if loader.check_event(SequenceEndEvent):
+                    yield key, EMPTY
+                while not loader.check_event(SequenceEndEvent):
+                    yield key, loader.construct_document(_compose(loader, anchors))
+                loader.get_event()
+            else:
+                value = loader.construct_document(_compose(loader, anchors))
+                if key not in SECTIONS:
+                    yield key, value
+                elif value:
+                    raise CatalogImportError(f'Раздел {key} должен быть списком')
+                else:
+                    yield key, EMPTY
+    finally:
+        loader.dispose()
+
+
+def iter_batches(stream, batch_size=BATCH_SIZE):
+    """
+    Группирует записи разделов `categories` и `goods` в пакеты не длиннее
+    batch_size, пустой раздел - пустой пакет; остальные ключи документа
+    отдаются как есть
+    """
+    section, batch = None, []
+    for key, value in iter_price_list(stream):
+        if batch and (key != section or len(batch) >= batch_size):
+            yield section, batch
+            batch = []
+        if value is EMPTY:
+            section = None
+            yield key, []
+        elif key in SECTIONS:
+            section = key
+            batch.append(value)
+        else:
+            section = None
+            yield key, value
+    if batch:
+        yield section, batch
+
+
+def import_price_list(stream, user, on_batch=None):
+    """
+    Импорт прайс-листа продавца user из потока; позиции магазина, которых
+    нет в файле, удаляются в конце.
+    Каждый пакет записывается в своей транзакции вместе со сбросом кеша
+    каталога, после него вызывается on_batch(importer). При ошибке записанные
+    пакеты остаются, индекс фильтров и суммы корзин пересчитываются по ним.
+    Для атомарного импорта всего файла вызов оборачивают в transaction.atomic()
+    """
+    importer = None
+    try:
+        for section, value in iter_batches(stream):
+            if section == 'shop':
+                shop, _ = Shop.objects.update_or_create(
+                    seller_id=user, defaults={'name': value})
+                importer = CatalogImporter(shop)
+                continue
+            if section not in SECTIONS:
+                continue
+            if importer is None:
+                raise CatalogImportError(
+                    'Название магазина должно быть указано в начале файла')
+            with transaction.atomic():
+                if section == 'categories':
+                    importer.import_categories(value)
+                else:
+                    importer.import_goods(value)
+                invalidate_catalog(importer.take_changes())
+            if on_batch is not None:
+                on_batch(importer)
+        if importer is None:
+            raise CatalogImportError('Не указано название магазина')
+        with transaction.atomic():
+            importer.finish()
+            invalidate_catalog(importer.take_changes())
+    except Exception:
+        if importer is not None:
+            abort_import(importer)
+        raise
+    return importer
+
+
+def abort_import(importer):
+    with transaction.atomic():
+        importer.abort()
+        invalidate_catalog(importer.take_changes())
@@ -0,0 +1,123 @@
+"""
+Витрина предложений магазинов.
+
+CatalogOffer хранит одну строку на позицию магазина с названием, моделью,
+категорией, ценами и параметрами товара в JSONB, чтобы список предложений
+отдавался одним запросом без соединений. Импорт обновляет строки
+изменившихся позиций и товаров после каждого пакета, одиночные изменения
+(например, через админку) обрабатываются сигналами post_save; удалённые
+позиции удаляются каскадом вместе с ShopProduct.
+"""
+from django.db.models import Q
+from django.db.models.signals import post_save
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from backend.facets import parse_constraints
+from backend.models import CatalogOffer, Category, Product, ProductInf, Shop, ShopProduct
+
+BATCH_SIZE = 1000
+
+OFFER_FIELDS = ('shop', 'shop_name', 'product', 'name', 'model', 'category', 'category_name',
+                'ext_id', 'quantity', 'price', 'price_rrc', 'parameters')
+
+
+def offer_ids(product_ids=(), category_ids=(), batch_size=BATCH_SIZE):
+    # позиции всех магазинов с товарами product_ids или из категорий category_ids
+    ids = set()
+    for field, values in (('product_id__in', list(product_ids)),
+                          ('product__category_id__in', list(category_ids))):
+        for start in range(0, len(values), batch_size):
+            ids.update(ShopProduct.objects.filter(
+                **{field: values[start:start + batch_size]}).values_list('id', flat=True))
+    return ids
+
+
+def refresh_offers(shop_product_ids=(), product_ids=(), category_ids=(), batch_size=BATCH_SIZE):
+    """
+    Пересборка строк витрины для позиций shop_product_ids, всех позиций
+    товаров product_ids и всех позиций в категориях category_ids
+    """
+    ids = sorted(set(shop_product_ids) | offer_ids(product_ids, category_ids, batch_size))
+    for start in range(0, len(ids), batch_size):
+        shop_products = list(ShopProduct.objects.filter(
+            id__in=ids[start:start + batch_size]).select_related('shop', 'product__category'))
+        parameters = {}
+        for product_id, name, value in ProductInf.objects.filter(
+                product_id__in={item.product_id for item in shop_products}).order_by(
+                'id').values_list('product_id', 'parameter__name', 'value'):
+            parameters.setdefault(product_id, {})[name] = value
+        CatalogOffer.objects.bulk_create(
+            [CatalogOffer(shop_product_id=item.id,
+                          shop_id=item.shop_id,
+                          shop_name=item.shop.name,
+                          product_id=item.product_id,
+                          name=item.product.name,
+                          model=item.product.model,
+                          category_id=item.product.category_id,
+                          category_name=item.product.category.name if item.product.category else '',
+                          ext_id=item.ext_id,
+                          quantity=item.quantity,
+                          price=item.price,
+                          price_rrc=item.price_rrc,
+                          parameters=parameters.get(item.product_id, {}))
+             for item in shop_products],
+            update_conflicts=True, unique_fields=['shop_product'], update_fields=OFFER_FIELDS)
+
+
+class OfferFilter(BaseFilterBackend):
+    """
+    Фильтр витрины по магазину, товару и категории (?shop=, ?product=,
+    ?category=) и по значениям параметров (?param=Название:значение)
+    через GIN-индекс по JSONB. Диапазоны поддерживает только /products/
+    """
+    id_params = ('shop', 'product', 'category')
+
+    def filter_queryset(self, request, queryset, view):
+        for param in self.id_params:
+            value = request.query_params.get(param, '').strip()
+            if not value:
+                continue
+            if not value.isdigit():
+                raise ValidationError(
+                    {'Errors': f'Неверный идентификатор в параметре {param}'})
+            queryset = queryset.filter(**{param + '_id': int(value)})
+        for name, conditions in parse_constraints(request.query_params.getlist('param')).items():
+            if any(isinstance(condition, tuple) for condition in conditions):
+                raise ValidationError(
+                    {'Errors': f'Диапазоны значений не поддерживаются для параметра {name}'})
+            query = Q()
+            for value in conditions:
+                query |= Q(parameters__contains={name: value})
+            queryset = queryset.filter(query)
+        return queryset
+
+
+def shop_saved(sender, instance, **kwargs):
+    CatalogOffer.objects.filter(shop_id=instance.id).exclude(
+        shop_name=instance.name).update(shop_name=instance.name)
+
+
+def category_saved(sender, instance, **kwargs):
+    refresh_offers(category_ids=[instance.id])
+
+
+def product_saved(sender, instance, **kwargs):
+    refresh_offers(product_ids=[instance.id])
+
+
+def shop_product_saved(sender, instance, **kwargs):
+    refresh_offers([instance.id])
+
+
+def product_inf_saved(sender, instance, **kwargs):
+    refresh_offers(product_ids=[instance.product_id])
+
+
+post_save.connect(shop_saved, sender=Shop, dispatch_uid='offer_shop_saved')
+post_save.connect(category_saved, sender=Category, dispatch_uid='offer_category_saved')
+post_save.connect(product_saved, sender=Product, dispatch_uid='offer_product_saved')
+post_save.connect(shop_product_saved, sender=ShopProduct,
+                  dispatch_uid='offer_shop_product_saved')
+post_save.connect(product_inf_saved, sender=ProductInf,
+                  dispatch_uid='offer_product_inf_saved')
@@ -0,0 +1,85 @@
+"""
+JSON на orjson для ответов и запросов API.
+
+ORJSONRenderer и ORJSONParser подключены в REST_FRAMEWORK вместо
+JSONRenderer и JSONParser, JsonResponse заменяет django.http.JsonResponse
+во вьюхах. Типы, которых orjson не знает (Decimal, ленивые строки
+перевода, QuerySet и т.п.), преобразуются кодировщиком DRF. Без
+установленного orjson все три класса работают через стандартный json.
+"""
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.http import JsonResponse as DjangoJsonResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # ключи словарей не только строки и даты в UTC с 'Z', как у стандартного json и DRF
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+
+_encoder = JSONEncoder()
+
+# U+2028 и U+2029 допустимы в JSON, но не в JavaScript, DRF их экранирует
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def dumps(data, indent=False):
+    content = orjson.dumps(data, default=_encoder.default,
+                           option=OPTIONS | orjson.OPT_INDENT_2 if indent else OPTIONS)
+    for raw, escaped in LINE_SEPARATORS:
+        if raw in content:
+            content = content.replace(raw, escaped)
+    return content
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        return dumps(data, bool(self.get_indent(accepted_media_type, renderer_context or {})))
+
+
+class ORJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            data = stream.read()
+            # orjson читает только UTF-8
+            if encoding.lower().replace('-', '') != 'utf8':
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class JsonResponse(DjangoJsonResponse):
+    """
+    django.http.JsonResponse на orjson. С другим encoder или
+    json_dumps_params ответ собирается стандартным json, как в Django
+    """
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, safe=True, json_dumps_params=None, **kwargs):
+        if orjson is None or encoder is not DjangoJSONEncoder or json_dumps_params is not None:
+            super().__init__(data, encoder, safe, json_dumps_params, **kwargs)
+            return
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                'In order to allow non-dict objects to be serialized set the '
+                'safe parameter to False.'
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        HttpResponse.__init__(self, content=dumps(data), **kwargs)
@@ -0,0 +1,218 @@
+"""
+Кеш ответов каталога.
+
+Ответ хранится в кеше 'catalog' под ключом из маршрута, параметров
+запроса, заголовка Accept и версии ресурса. Версии ресурсов хранятся в
+CatalogVersion: импорт и изменения через админку увеличивают версии
+ресурсов, зависящих от изменившихся таблиц, поэтому кеши всех процессов
+устаревают одновременно. Тот же ключ служит ETag, на If-None-Match с
+совпадающим значением отдаётся 304 без обращения к кешу. Кешируются
+только JSON-ответы: страницы Browsable API содержат имя пользователя и
+CSRF-токен.
+
+Остатки меняются при каждом оформлении заказа, поэтому для них версия
+ведётся по магазинам (строки CatalogVersion 'stock:<id магазина>'): ответ
+ресурсов с остатками хранится вместе с версиями остатков магазинов из
+него и устаревает, только когда изменились остатки одного из них.
+"""
+import hashlib
+
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from backend.models import (CatalogVersion, Category, Contact, Parameter, Product, ProductInf, Shop,
+                            ShopProduct, User)
+
+CACHE_ALIAS = 'catalog'
+
+# таблицы, от которых зависит ответ каждого ресурса (с учётом вложенных сериализаторов)
+RESOURCES = {
+    'categories': {'categories'},
+    'shops': {'shops', 'users'},
+    'products': {'categories', 'products', 'parameters', 'product_inf'},
+    'products_in_shop': {'shops', 'users', 'categories', 'products', 'shop_products',
+                         'parameters', 'product_inf'},
+    'product_inf': {'products', 'parameters', 'product_inf'},
+    'offers': {'shops', 'categories', 'products', 'shop_products', 'parameters', 'product_inf'},
+}
+
+# ресурсы с остатками позиций; поле shop их записей - id магазина или магазин с id
+STOCK_RESOURCES = {'products_in_shop', 'offers'}
+
+STOCK_PREFIX = 'stock:'
+
+MODEL_TABLES = {
+    Category: 'categories',
+    Shop: 'shops',
+    User: 'users',
+    Contact: 'users',
+    Product: 'products',
+    ShopProduct: 'shop_products',
+    Parameter: 'parameters',
+    ProductInf: 'product_inf',
+}
+
+# удаление позиций и параметров идёт массово при импорте, обработчик
+# post_delete отключил бы быстрое удаление, импорт сбрасывает кеш сам
+NO_DELETE_SIGNAL = (ShopProduct, ProductInf)
+
+# пользователи и контакты входят в ответы только как продавцы магазинов
+SELLER_MODELS = (User, Contact)
+
+# поля, сохранение только которых не меняет ответы (вход в систему)
+USER_IGNORED_FIELDS = {'last_login'}
+
+
+def invalidate_catalog(tables):
+    """
+    Увеличение версий ресурсов, зависящих от таблиц tables.
+    В транзакции новая версия видна другим процессам после её фиксации
+    """
+    tables = set(tables)
+    bump_versions([resource for resource, depends in RESOURCES.items() if depends & tables])
+
+
+def invalidate_stock(shop_ids):
+    """
+    Увеличение версий остатков магазинов shop_ids: устаревают только
+    ответы с позициями этих магазинов
+    """
+    bump_versions([f'{STOCK_PREFIX}{shop_id}' for shop_id in sorted(set(shop_ids))])
+
+
+def bump_versions(names):
+    if not names:
+        return
+    updated = CatalogVersion.objects.filter(
+        name__in=names).update(version=F('version') + 1)
+    if updated < len(names):
+        CatalogVersion.objects.bulk_create(
+            [CatalogVersion(name=name, version=1) for name in names],
+            ignore_conflicts=True)
+
+
+def catalog_version(resource):
+    return CatalogVersion.objects.filter(name=resource).values_list(
+        'version', flat=True).first() or 0
+
+
+def stock_versions(shop_ids=None):
+    # {id магазина: версия остатков}; без shop_ids - все магазины с версией
+    rows = CatalogVersion.objects.filter(name__startswith=STOCK_PREFIX)
+    if shop_ids is not None:
+        rows = rows.filter(name__in=[f'{STOCK_PREFIX}{shop_id}' for shop_id in shop_ids])
+    versions = {int(name[len(STOCK_PREFIX):]): version
+                for name, version in rows.values_list('name', 'version')}
+    if shop_ids is None:
+        return versions
+    return {shop_id: versions.get(shop_id, 0) for shop_id in shop_ids}
+
+
+def response_shops(data):
+    # id магазинов из записей ответа ресурса с остатками
+    if isinstance(data, dict):
+        data = data['results'] if 'results' in data else [data]
+    shops = set()
+    for item in data:
+        shop = item.get('shop')
+        shops.add(shop['id'] if isinstance(shop, dict) else shop)
+    shops.discard(None)
+    return shops
+
+
+def entity_tag(key, stock):
+    if not stock:
+        return f'"{key}"'
+    variant = ','.join(f'{shop_id}:{version}' for shop_id, version in sorted(stock.items()))
+    return f'"{key}:{hashlib.md5(variant.encode()).hexdigest()}"'
+
+
+def cache_key(resource, request):
+    version = catalog_version(resource)
+    variant = '\n'.join((request.get_host(), request.get_full_path(),
+                         request.META.get('HTTP_ACCEPT', '')))
+    return f'{resource}:{version}:{hashlib.md5(variant.encode("utf8")).hexdigest()}'
+
+
+class CachedResponseMixin:
+    """
+    Кеширование GET-ответов вьюсета; имя ресурса в RESOURCES задаётся
+    атрибутом cache_resource
+    """
+    cache_resource = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        key = cache_key(self.cache_resource, request)
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        tracks_stock = self.cache_resource in STOCK_RESOURCES
+        # ETag ответа с остатками зависит от его магазинов, они известны из кеша
+        if not tracks_stock and entity_tag(key, {}) in etags:
+            return self.not_modified(entity_tag(key, {}))
+        cache = caches[CACHE_ALIAS]
+        cached = cache.get(key)
+        if cached is not None:
+            content, content_type, stock = cached
+            if stock and stock_versions(stock) != stock:
+                cached = None
+        if cached is not None:
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            # версии читаются до ответа: продажа во время его сборки сделает
+            # запись устаревшей, а не закрепит старый остаток
+            versions = stock_versions() if tracks_stock else {}
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if not is_json(response):
+                patch_vary_headers(response, ('Accept', 'Cookie', 'Authorization'))
+                return response
+            response.render()
+            stock = {shop_id: versions.get(shop_id, 0)
+                     for shop_id in response_shops(response.data)} if tracks_stock else {}
+            cache.set(key, (response.content, response['Content-Type'], stock))
+        etag = entity_tag(key, stock)
+        if etag in etags:
+            return self.not_modified(etag)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+    @staticmethod
+    def not_modified(etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Accept',))
+        return response
+
+
+def is_json(response):
+    renderer = getattr(response, 'accepted_renderer', None)
+    return renderer is not None and renderer.media_type == 'application/json'
+
+
+def model_changed(sender, **kwargs):
+    invalidate_catalog({MODEL_TABLES[sender]})
+
+
+def seller_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= USER_IGNORED_FIELDS:
+        return
+    user_id = instance.id if sender is User else instance.user_id
+    if Shop.objects.filter(seller_id=user_id).exists():
+        invalidate_catalog({MODEL_TABLES[sender]})
+
+
+for model in MODEL_TABLES:
+    handler = seller_changed if model in SELLER_MODELS else model_changed
+    post_save.connect(handler, sender=model,
+                      dispatch_uid=f'catalog_cache_save_{model.__name__}')
+    # удаление продавца удаляет и магазин, кеш сбрасывает сигнал Shop
+    if model not in NO_DELETE_SIGNAL and model is not User:
+        post_delete.connect(handler, sender=model,
+                            dispatch_uid=f'catalog_cache_delete_{model.__name__}')
@@ -0,0 +1,72 @@
+"""
+Полнотекстовый поиск товаров.
+
+Название и модель товара хранятся в Product.search_vector (tsvector с
+GIN-индексом), вектор обновляется при импорте для новых товаров и
+сигналом post_save при остальных сохранениях (например, через админку).
+Категория в вектор не входит. Коды моделей вроде
+apple/iphone/xr ищутся по сходству триграмм (pg_trgm).
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, IntegerField, Q
+from django.db.models.functions import Cast
+from django.db.models.signals import post_save
+from rest_framework.filters import BaseFilterBackend
+
+from backend.models import Product
+
+# ранг умножается на RANK_SCALE и приводится к целому, чтобы служить ключом курсора
+RANK_SCALE = 1000000
+
+
+def search_config():
+    return getattr(settings, 'SEARCH_CONFIG', 'russian')
+
+
+def product_search_vector():
+    return (SearchVector('name', weight='A', config=search_config())
+            + SearchVector('model', weight='B', config=search_config()))
+
+
+def update_search_vectors(product_ids):
+    # вне PostgreSQL поиск работает через icontains, вектор не нужен
+    if connection.vendor != 'postgresql' or not product_ids:
+        return
+    Product.objects.filter(id__in=product_ids).update(
+        search_vector=product_search_vector())
+
+
+def product_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'model'} & set(update_fields):
+        return
+    update_search_vectors([instance.id])
+
+
+post_save.connect(product_saved, sender=Product, dispatch_uid='search_product_saved')
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    """
+    Поиск по параметру ?q= с сортировкой по релевантности.
+    Путь от модели вьюсета до товара задаётся атрибутом search_product_path
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        term = request.query_params.get(self.search_param, '').strip()
+        if not term:
+            return queryset
+        prefix = getattr(view, 'search_product_path', '')
+        if connection.vendor != 'postgresql':
+            return queryset.filter(Q(**{prefix + 'name__icontains': term})
+                                   | Q(**{prefix + 'model__icontains': term}))
+        query = SearchQuery(term, config=search_config(),
+                            search_type='websearch')
+        rank = SearchRank(F(prefix + 'search_vector'), query) + \
+            TrigramSimilarity(prefix + 'model', term)
+        return queryset.annotate(
+            search_rank=Cast(rank * RANK_SCALE, IntegerField())
+        ).filter(Q(**{prefix + 'search_vector': query})
+                 | Q(**{prefix + 'model__trigram_similar': term}))
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from backend.models import Shop, Contact, User, Category, Product, ShopProduct, Parameter, ProductInf
+from backend.models import Shop, Contact, User, Category, Product, ShopProduct, Parameter, ProductInf, ImportJob, CatalogOffer, Order, OrderItem, ShopOrder
 from rest_framework.exceptions import ValidationError
 import re
 
@@ -97,3 +97,57 @@ class ShopProductSerializer(serializers.ModelSerializer):
         fields = ('id', 'shop', 'product', 'ext_id',
                   'quantity', 'price', 'price_rrc')
         read_only_fields = ('id',)
+
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = ('id', 'state', 'progress', 'stats', 'error', 'attempts',
+                  'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
+
+
+class CatalogOfferSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CatalogOffer
+        fields = ('id', 'shop', 'shop_name', 'product', 'name', 'model', 'category', 'category_name',
+                  'ext_id', 'quantity', 'price', 'price_rrc', 'parameters')
+        read_only_fields = fields
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    shop = serializers.IntegerField(source='shop_product.shop_id', read_only=True)
+    shop_name = serializers.CharField(source='shop_product.shop.name', read_only=True)
+    name = serializers.CharField(source='shop_product.product.name', read_only=True)
+    model = serializers.CharField(source='shop_product.product.model', read_only=True)
+
+    class Meta:
+        model = OrderItem
+        fields = ('id', 'shop_product', 'shop', 'shop_name', 'name', 'model', 'price', 'quantity')
+        read_only_fields = fields
+
+
+class BasketSerializer(serializers.ModelSerializer):
+    ordered_items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ('id', 'state', 'dt', 'ordered_items', 'total_sum', 'items_count')
+        read_only_fields = fields
+
+
+class OrderSerializer(BasketSerializer):
+    class Meta(BasketSerializer.Meta):
+        fields = ('id', 'state', 'dt', 'user_contact', 'ordered_items', 'total_sum', 'items_count')
+        read_only_fields = fields
+
+
+class ShopOrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+    contact = ContactSerializer(source='order.user_contact', read_only=True)
+    email = serializers.EmailField(source='order.user.email', read_only=True)
+
+    class Meta:
+        model = ShopOrder
+        fields = ('id', 'order', 'state', 'dt', 'total_sum', 'items_count', 'email', 'contact', 'items')
+        read_only_fields = fields
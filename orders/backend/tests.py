@@ -0,0 +1,839 @@
+import io
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+import yaml
+from django.contrib.auth.models import update_last_login
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed, ErrorDetail, ValidationError
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.test import APIClient
+
+from backend.authentication import CachedTokenAuthentication, token_cache
+from backend.basket import save_items
+from backend.checkout import CheckoutError, place_order
+from backend.db.router import ReplicaRouter, read_from_replica
+from backend.jobs import claim_jobs, last_applied_checksum, release_stale_jobs
+from backend.models import (CatalogOffer, Category, Contact, FacetValue, ImportJob, Order, OrderEvent,
+                            OrderItem, OutgoingEmail, Parameter, Product, ProductInf, ShopFiles, ShopOrder,
+                            ShopProduct, STATE_CHOICES, User)
+from backend.notifications import enqueue_order_events, flush_order_events
+from backend.outbox import Sender, claim_emails, enqueue_email, send_pending
+from backend.price_list import import_price_list
+from backend.renderers import ORJSONRenderer
+from backend.response_cache import CACHE_ALIAS
+from backend.serializers import BasketSerializer, OrderSerializer
+from backend.views import CategoryViewSet
+
+CATEGORIES = [{'id': 1, 'name': 'Смартфоны'}, {'id': 2, 'name': 'Аксессуары'}]
+
+
+def goods_item(ext_id, category=1, name=None, model=None, price=1000, quantity=10, parameters=None):
+    return {'id': ext_id, 'category': category, 'model': model or f'model/{ext_id}',
+            'name': name or f'Товар {ext_id}', 'price': price, 'price_rrc': price,
+            'quantity': quantity,
+            'parameters': parameters if parameters is not None else {
+                'Цвет': 'черный' if ext_id % 2 else 'белый', 'Память (ГБ)': str(64 * (ext_id % 3 + 1))}}
+
+
+def price_list(shop, goods, categories=CATEGORIES):
+    data = {'shop': shop, 'categories': categories, 'goods': goods}
+    return yaml.safe_dump(data, allow_unicode=True, sort_keys=False).encode()
+
+
+def create_user(number, type='buyer'):
+    user = User.object.create_user(f'{type}{number}@example.com', type=type, is_active=True)
+    Contact.objects.create(user=user, country='Россия', region='Москва', zip=101000,
+                           city='Москва', street='Тверская', house='1', phone='+70000000000')
+    return user
+
+
+def create_seller(number):
+    return create_user(number, 'seller')
+
+
+def import_goods(seller, goods, shop=None, categories=CATEGORIES):
+    return import_price_list(io.BytesIO(price_list(shop or f'Магазин {seller.id}', goods, categories)),
+                             seller.id)
+
+
+class CatalogQueryCountTest(TestCase):
+    # число запросов списков каталога не зависит от числа магазинов, товаров и параметров;
+    # первый запрос каждого ответа - версия ресурса для ключа кеша, у ресурсов
+    # с остатками второй - версии остатков магазинов
+    QUERIES = {
+        '/categories/': 2,
+        '/shops/': 3,
+        '/products/': 3,
+        '/products_in_shop/': 5,
+        '/product_inf/': 2,
+        '/offers/': 3,
+    }
+
+    def assertQueriesConstant(self):
+        for url, queries in self.QUERIES.items():
+            caches[CACHE_ALIAS].clear()
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.json()['results'])
+
+    def test_catalog_lists(self):
+        import_goods(create_seller(1), [goods_item(number) for number in range(3)])
+        self.assertQueriesConstant()
+        for number in range(2, 5):
+            import_goods(create_seller(number), [goods_item(number * 100 + item, category=item % 2 + 1)
+                                                 for item in range(20)])
+        self.assertQueriesConstant()
+
+
+def seq_scans(plan):
+    # таблицы, которые план EXPLAIN (FORMAT JSON) читает последовательным сканированием
+    tables = [plan['Relation Name']] if plan['Node Type'] == 'Seq Scan' else []
+    for child in plan.get('Plans', []):
+        tables += seq_scans(child)
+    return tables
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Планы запросов проверяются только для PostgreSQL')
+class QueryPlanTest(TestCase):
+    """
+    Горячие запросы импорта и каталога не читают большие таблицы целиком.
+    Последовательное сканирование запрещено (enable_seqscan = off), поэтому
+    оно остаётся в плане, только если подходящего индекса нет, и результат
+    не зависит от объёма тестовых данных и их статистики
+    """
+    LARGE_TABLES = {model._meta.db_table for model in (
+        Product, ShopProduct, Parameter, ProductInf, Order, CatalogOffer, FacetValue)}
+
+    def hot_queries(self):
+        importer = import_goods(create_seller(1), [goods_item(number) for number in range(50)])
+        buyers = [create_user(number) for number in range(2)]
+        Order.objects.bulk_create([Order(user=buyer, state=state) for buyer in buyers
+                                   for state, _ in STATE_CHOICES if state != 'basket'])
+        shop_products = list(ShopProduct.objects.filter(shop=importer.shop).values_list(
+            'ext_id', 'product_id')[:10])
+        product_ids = [product_id for _, product_id in shop_products]
+        product_inf = ProductInf.objects.select_related('parameter').first()
+        return [
+            ('товары по названию (импорт)',
+             Product.objects.filter(name__in=['Товар 1', 'Товар 2'])),
+            ('позиции магазина по ext_id (импорт)',
+             ShopProduct.objects.filter(shop=importer.shop,
+                                        ext_id__in=[ext_id for ext_id, _ in shop_products])),
+            ('параметры по названию (импорт)',
+             Parameter.objects.filter(name__in=[product_inf.parameter.name])),
+            ('параметры товаров (импорт, сериализаторы)',
+             ProductInf.objects.filter(product_id__in=product_ids)),
+            ('товары по значению параметра (фильтры)',
+             ProductInf.objects.filter(parameter_id=product_inf.parameter_id,
+                                       value=product_inf.value).values('product_id')),
+            ('заказы пользователя по статусу',
+             Order.objects.filter(user=buyers[0], state='new')),
+            ('витрина по категории', CatalogOffer.objects.filter(category_id=1).order_by('id')[:50]),
+            ('индекс фильтров по категории', FacetValue.objects.filter(category_id=1)),
+        ]
+
+    def test_hot_queries_use_indexes(self):
+        queries = self.hot_queries()
+        with connection.cursor() as cursor:
+            # SET LOCAL действует до конца транзакции теста
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset in queries:
+            with self.subTest(query=name):
+                plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+                self.assertFalse(set(seq_scans(plan)) & self.LARGE_TABLES, queryset.explain())
+
+
+class StockReservationTest(TransactionTestCase):
+    """
+    Оформление заказов на одну позицию из нескольких потоков, у каждого
+    потока своё соединение и свои транзакции
+    """
+    THREADS = 8
+    ORDERS = 5
+    STOCK = 20
+
+    def setUp(self):
+        importer = import_goods(create_seller(1), [goods_item(1, quantity=self.STOCK),
+                                                   goods_item(2, quantity=2)])
+        self.shop_products = dict(ShopProduct.objects.filter(shop=importer.shop).values_list('ext_id', 'id'))
+        self.buyers = [create_user(number) for number in range(self.THREADS)]
+
+    def place(self, buyer, items):
+        basket = save_items(buyer.id, items, replace=True)
+        return place_order(buyer.id, basket.id, buyer.contacts.get().id)
+
+    def stock(self, ext_id):
+        shop_product_id = self.shop_products[ext_id]
+        return (ShopProduct.objects.get(id=shop_product_id).quantity,
+                CatalogOffer.objects.get(shop_product_id=shop_product_id).quantity)
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        shop_product_id = self.shop_products[1]
+        placed, rejected, errors = [], [], []
+        barrier = threading.Barrier(self.THREADS)
+
+        def buyer_loop(buyer):
+            barrier.wait()
+            try:
+                for _ in range(self.ORDERS):
+                    try:
+                        placed.append(self.place(buyer, {shop_product_id: 1}).id)
+                    except CheckoutError as error:
+                        rejected.append(error)
+                    except Exception as error:
+                        errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer_loop, args=(buyer,)) for buyer in self.buyers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(placed) + len(rejected), self.THREADS * self.ORDERS)
+        self.assertLessEqual(len(placed), self.STOCK)
+        self.assertEqual(Order.objects.filter(id__in=placed, state='new').count(), len(placed))
+        self.assertEqual(self.stock(1), (self.STOCK - len(placed),) * 2)
+        # спрос вдвое больше остатка: остаток продан целиком, остальным отказано из-за нехватки
+        self.assertEqual(len(placed), self.STOCK)
+        for error in rejected:
+            self.assertEqual(error.failed, [{'shop_product': shop_product_id, 'requested': 1,
+                                             'available': 0}])
+
+    def test_reupload_restores_sold_stock(self):
+        seller = User.objects.get(email='seller1@example.com')
+        goods = [goods_item(1, quantity=self.STOCK), goods_item(2, quantity=2)]
+        shop_file = ShopFiles.objects.create(shop=seller.shop, checksum='price-list')
+        ImportJob.objects.create(user=seller, file=shop_file, state='done')
+        self.assertEqual(last_applied_checksum(seller.id), 'price-list')
+        self.place(self.buyers[0], {self.shop_products[1]: 3})
+        # хеш проданной позиции сброшен, тот же файл не пропускается и возвращает остаток
+        self.assertEqual(ShopProduct.objects.get(id=self.shop_products[1]).content_hash, '')
+        self.assertIsNone(last_applied_checksum(seller.id))
+        importer = import_goods(seller, goods)
+        self.assertEqual(importer.stats['shop_products']['updated'], 1)
+        self.assertEqual(self.stock(1), (self.STOCK, self.STOCK))
+        self.assertEqual(last_applied_checksum(seller.id), 'price-list')
+
+    def test_shortage_lists_failed_lines(self):
+        items = {self.shop_products[1]: 3, self.shop_products[2]: 5}
+        with self.assertRaises(CheckoutError) as context:
+            self.place(self.buyers[0], items)
+        self.assertEqual(context.exception.failed, [
+            {'shop_product': self.shop_products[2], 'requested': 5, 'available': 2}])
+        # транзакция откатывается целиком, остатки и витрина не меняются
+        self.assertEqual(self.stock(1), (self.STOCK, self.STOCK))
+        self.assertEqual(self.stock(2), (2, 2))
+        self.assertTrue(Order.objects.filter(user=self.buyers[0], state='basket').exists())
+
+
+class OrderPriceTest(TestCase):
+
+    def test_prices_fixed_at_checkout(self):
+        seller, buyer = create_seller(1), create_user(1)
+        goods = [goods_item(1, price=100), goods_item(2, price=250)]
+        importer = import_goods(seller, goods)
+        ids = dict(ShopProduct.objects.filter(shop=importer.shop).values_list('ext_id', 'id'))
+        basket = save_items(buyer.id, {ids[1]: 2, ids[2]: 1}, replace=True)
+        order = place_order(buyer.id, basket.id, buyer.contacts.get().id)
+        # цена позиции меняется, вторая позиция удаляется из прайса
+        goods[0]['price'] = 999
+        import_goods(seller, goods[:1])
+        data = OrderSerializer(Order.objects.get(id=order.id)).data
+        self.assertEqual([(item['price'], item['quantity']) for item in data['ordered_items']],
+                         [(100, 2), (250, 1)])
+        self.assertEqual(data['total_sum'], 450)
+        self.assertEqual(ShopOrder.objects.get(order=order).total_sum, 450)
+        # в корзине действует текущая цена
+        basket = save_items(buyer.id, {ids[1]: 1})
+        self.assertEqual([item['price'] for item in BasketSerializer(basket).data['ordered_items']], [999])
+        self.assertEqual(basket.total_sum, 999)
+
+
+class BasketTest(TestCase):
+
+    def setUp(self):
+        importer = import_goods(create_seller(1), [goods_item(1, price=100), goods_item(2, price=250)])
+        self.ids = dict(ShopProduct.objects.filter(shop=importer.shop).values_list('ext_id', 'id'))
+        self.buyer = create_user(1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def request(self, method, items):
+        response = getattr(self.client, method)('/basket', {'items': [
+            {'shop_product': self.ids[ext_id], 'quantity': quantity} for ext_id, quantity in items]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(dict(OrderItem.objects.filter(order__user=self.buyer).values_list(
+            'shop_product_id', 'quantity')),
+            {item['shop_product']: item['quantity'] for item in data['ordered_items']})
+        return {item['shop_product']: item['quantity'] for item in data['ordered_items']}, data['total_sum']
+
+    def test_repeated_items_merged(self):
+        self.assertEqual(self.request('post', [(1, 2), (2, 1), (1, 3)]),
+                         ({self.ids[1]: 5, self.ids[2]: 1}, 750))
+
+    def test_post_adds_quantity(self):
+        self.request('post', [(1, 2)])
+        self.assertEqual(self.request('post', [(1, 1), (2, 1)]),
+                         ({self.ids[1]: 3, self.ids[2]: 1}, 550))
+        self.assertEqual(Order.objects.filter(user=self.buyer).count(), 1)
+
+    def test_put_replaces_quantity(self):
+        self.request('post', [(1, 2), (2, 4)])
+        # позиции, не переданные в PUT, остаются в корзине
+        self.assertEqual(self.request('put', [(1, 1), (1, 1)]),
+                         ({self.ids[1]: 2, self.ids[2]: 4}, 1200))
+
+    def test_unknown_item_rejected(self):
+        self.request('post', [(1, 2)])
+        response = self.client.post('/basket', {'items': [
+            {'shop_product': self.ids[1], 'quantity': 1}, {'shop_product': 0, 'quantity': 1}]}, format='json')
+        self.assertFalse(response.json()['Status'])
+        # корзина не меняется
+        self.assertEqual(OrderItem.objects.get(order__user=self.buyer).quantity, 2)
+
+
+class TokenCacheTest(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.user = create_user(1)
+        self.token = Token.objects.create(user=self.user)
+
+    def authenticate(self):
+        return CachedTokenAuthentication().authenticate_credentials(self.token.key)[0]
+
+    def test_cache_hit(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.authenticate().id, self.user.id)
+
+    def test_password_change(self):
+        self.authenticate()
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertTrue(self.authenticate().check_password('new-password'))
+
+    def test_deactivated_user(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_token_deleted(self):
+        response = self.client.get('/basket', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.token.delete()
+        response = self.client.get('/basket', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, 401)
+
+
+class ReplicaRouterTest(TransactionTestCase):
+    # внутри TestCase соединение всегда в транзакции, поэтому TransactionTestCase;
+    # пригодность реплик задаётся результатом последней проверки, соединения с ними не нужны
+    REPLICAS = ['replica_1', 'replica_2']
+
+    def setUp(self):
+        with self.settings(REPLICA_DATABASES=self.REPLICAS):
+            self.router = ReplicaRouter()
+        self.set_healthy(*self.REPLICAS)
+
+    def set_healthy(self, *healthy):
+        self.router.checked = {alias: (time.monotonic(), alias in healthy) for alias in self.REPLICAS}
+
+    def test_outside_request(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+        self.assertIsNone(self.router.db_for_write(Product))
+
+    def test_one_replica_per_request(self):
+        aliases = []
+        for _ in range(2):
+            with read_from_replica():
+                alias = self.router.db_for_read(Product)
+                self.assertEqual(self.router.db_for_read(Category), alias)
+                aliases.append(alias)
+        self.assertEqual(aliases, self.REPLICAS)
+
+    def test_primary_after_write(self):
+        with read_from_replica():
+            self.assertIn(self.router.db_for_read(Product), self.REPLICAS)
+            self.assertEqual(self.router.db_for_write(Product), 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+        with read_from_replica():
+            self.assertIn(self.router.db_for_read(Product), self.REPLICAS)
+
+    def test_primary_inside_atomic(self):
+        with read_from_replica():
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(Product), 'default')
+            self.assertIn(self.router.db_for_read(Product), self.REPLICAS)
+
+    def test_unhealthy_replicas_skipped(self):
+        self.set_healthy('replica_2')
+        for _ in range(2):
+            with read_from_replica():
+                self.assertEqual(self.router.db_for_read(Product), 'replica_2')
+        self.set_healthy()
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+
+
+class OutboxTest(TestCase):
+
+    def test_batch_claimed_before_sending(self):
+        emails = [enqueue_email('Тема', 'Текст', [f'user{number}@example.com']) for number in range(3)]
+        states = []
+
+        class RecordingSender(Sender):
+            def send(self, email):
+                # строка уже помечена и не заблокирована транзакцией отправителя
+                states.append(OutgoingEmail.objects.get(id=email.id).state)
+                super().send(email)
+
+        self.assertEqual(send_pending(sender=RecordingSender()), (3, 0))
+        self.assertEqual(states, ['sending'] * 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(set(OutgoingEmail.objects.filter(id__in=[email.id for email in emails]).values_list(
+            'state', flat=True)), {'sent'})
+
+    def test_abandoned_batch_is_reclaimed(self):
+        email = enqueue_email('Тема', 'Текст', ['user@example.com'])
+        claim_emails(10)
+        self.assertEqual(send_pending(), (0, 0))
+        OutgoingEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_pending(), (1, 0))
+
+    def test_events_without_emails_do_not_stop_flush(self):
+        buyers = [create_user(number) for number in range(3)]
+        User.objects.filter(id=buyers[0].id).update(email='')
+        for buyer in buyers:
+            order = Order.objects.create(user=buyer, state='new')
+            enqueue_order_events([(buyer.id, order.id, 'confirmed')])
+        # первый пакет - покупатель без адреса: писем нет, но события обработаны
+        self.assertEqual(flush_order_events(window=0, batch_size=1), 1)
+        # close_old_connections закрыл бы соединение внутри транзакции теста
+        with mock.patch('backend.management.commands.send_emails.close_old_connections'):
+            call_command('send_emails', '--once', '--window', '0', stdout=io.StringIO())
+        self.assertFalse(OrderEvent.objects.exists())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         [buyer.email for buyer in buyers[1:]])
+
+
+def create_job(seller, checksum='', state='queued', **fields):
+    shop_file = ShopFiles.objects.create(checksum=checksum)
+    return ImportJob.objects.create(user=seller, file=shop_file, state=state, **fields)
+
+
+class ImportJobTest(TestCase):
+
+    def setUp(self):
+        self.seller = create_seller(1)
+        import_goods(self.seller, [goods_item(1)])
+
+    def test_failed_import_disables_checksum_shortcut(self):
+        create_job(self.seller, 'a', 'done')
+        self.assertEqual(last_applied_checksum(self.seller.id), 'a')
+        # задача с файлом b упала на середине: в каталоге часть b, файл a применяется заново
+        create_job(self.seller, 'b', 'failed')
+        self.assertIsNone(last_applied_checksum(self.seller.id))
+        create_job(self.seller, 'a', 'running')
+        self.assertIsNone(last_applied_checksum(self.seller.id))
+        create_job(self.seller, 'a', 'done')
+        self.assertEqual(last_applied_checksum(self.seller.id), 'a')
+
+
+    def test_job_claimed_once(self):
+        jobs = [create_job(self.seller).id for _ in range(3)]
+        self.assertEqual(claim_jobs(2), jobs[:2])
+        self.assertEqual(claim_jobs(10), jobs[2:])
+        self.assertEqual(claim_jobs(10), [])
+        self.assertEqual(set(ImportJob.objects.filter(id__in=jobs).values_list('state', 'attempts')),
+                         {('running', 1)})
+
+    @override_settings(IMPORT_JOB_TIMEOUT=60, IMPORT_JOB_MAX_ATTEMPTS=3)
+    def test_stale_jobs_requeued(self):
+        now = timezone.now()
+        old = now - timedelta(minutes=5)
+        alive = create_job(self.seller, state='running', started_at=old, heartbeat_at=now, attempts=1)
+        stale = create_job(self.seller, state='running', started_at=old, heartbeat_at=old, attempts=1)
+        # обработчик упал до первой отметки
+        silent = create_job(self.seller, state='running', started_at=old, attempts=2)
+        exhausted = create_job(self.seller, state='running', started_at=old, heartbeat_at=old, attempts=3)
+        self.assertEqual(claim_jobs(10), [stale.id, silent.id])
+        self.assertEqual(dict(ImportJob.objects.values_list('id', 'attempts')),
+                         {alive.id: 1, stale.id: 2, silent.id: 3, exhausted.id: 3})
+        self.assertEqual(ImportJob.objects.get(id=exhausted.id).state, 'failed')
+        self.assertEqual(release_stale_jobs(), (0, 0))
+
+
+class ConcurrentClaimTest(TransactionTestCase):
+    # обработчики захватывают задачи одновременно, каждый в своём соединении
+    THREADS = 4
+    JOBS = 20
+
+    def test_no_double_claim(self):
+        seller = create_seller(1)
+        jobs = [create_job(seller).id for _ in range(self.JOBS)]
+        claimed, errors = [], []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            barrier.wait()
+            try:
+                claimed.extend(claim_jobs(self.JOBS))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(claimed), jobs)
+        self.assertEqual(set(ImportJob.objects.values_list('state', 'attempts')), {('running', 1)})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск работает только в PostgreSQL')
+class ProductSearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        import_goods(create_seller(1), [
+            goods_item(1, name='Смартфон Apple iPhone XR', model='apple/iphone/xr'),
+            goods_item(2, name='Чехол силиконовый', model='iphone-case', category=2),
+            goods_item(3, name='Смартфон Samsung Galaxy', model='samsung/galaxy'),
+        ])
+        cls.products = dict(Product.objects.values_list('model', 'id'))
+
+    def search(self, url, term):
+        caches[CACHE_ALIAS].clear()
+        response = self.client.get(url, {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_ranking(self):
+        # совпадение в названии (вес A) выше совпадения в модели (вес B)
+        results = self.search('/products/', 'iphone')
+        self.assertEqual([product['id'] for product in results],
+                         [self.products['apple/iphone/xr'], self.products['iphone-case']])
+
+    def test_morphology(self):
+        results = self.search('/products/', 'смартфоны')
+        self.assertEqual({product['id'] for product in results},
+                         {self.products['apple/iphone/xr'], self.products['samsung/galaxy']})
+
+    def test_model_code_by_trigrams(self):
+        results = self.search('/products/', 'aple/iphone/xr')
+        self.assertEqual([product['id'] for product in results][:1], [self.products['apple/iphone/xr']])
+        self.assertNotIn(self.products['samsung/galaxy'], [product['id'] for product in results])
+
+    def test_nested_endpoints(self):
+        samsung = self.products['samsung/galaxy']
+        self.assertEqual([item['product']['id'] for item in self.search('/products_in_shop/', 'samsung')],
+                         [samsung])
+        self.assertEqual([item['product'] for item in self.search('/offers/', 'samsung')], [samsung])
+        self.assertEqual(len(self.search('/product_inf/', 'samsung')),
+                         ProductInf.objects.filter(product_id=samsung).count())
+
+    def test_empty_query(self):
+        self.assertEqual(len(self.search('/products/', ' ')), 3)
+
+    def test_renamed_product(self):
+        product = Product.objects.get(id=self.products['samsung/galaxy'])
+        product.name = 'Смартфон Xiaomi Redmi'
+        product.save()
+        self.assertEqual([item['id'] for item in self.search('/products/', 'xiaomi')], [product.id])
+        self.assertEqual([item['product'] for item in self.search('/offers/', 'redmi')], [product.id])
+
+
+def direct_facets(products):
+    # {параметр: {значение: число товаров}} напрямую по строкам ProductInf
+    counts = {}
+    for name, value in ProductInf.objects.filter(product__in=products).values_list(
+            'parameter__name', 'value').distinct('product_id', 'parameter_id', 'value').order_by():
+        values = counts.setdefault(name, {})
+        values[value] = values.get(value, 0) + 1
+    return counts
+
+
+def expected_facets(goods):
+    # {параметр: {значение: число товаров}} по записям прайс-листа, по одной на товар
+    counts = {}
+    for item in goods:
+        for name, value in item['parameters'].items():
+            values = counts.setdefault(name, {})
+            values[value] = values.get(value, 0) + 1
+    return counts
+
+
+class FacetCountTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        goods = [goods_item(number, category=number % 2 + 1) for number in range(20)]
+        import_goods(create_seller(1), goods)
+        # те же товары во втором магазине считаются один раз
+        import_goods(create_seller(2), goods[:8])
+
+    def facets(self, **params):
+        caches[CACHE_ALIAS].clear()
+        response = self.client.get('/products/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return {facet['parameter']: {value['value']: value['count'] for value in facet['values']}
+                for facet in response.json()['facets']}
+
+    def test_precomputed_counts(self):
+        self.assertEqual(self.facets(), direct_facets(Product.objects.all()))
+        self.assertEqual(self.facets(category=1), direct_facets(Product.objects.filter(category_id=1)))
+
+    def test_search_counts(self):
+        # с поиском счётчики считаются по ProductInf, а не по FacetValue
+        self.assertEqual(self.facets(q='товар', category=2),
+                         direct_facets(Product.objects.filter(category_id=2)))
+
+    def test_constrained_counts(self):
+        products = Product.objects.all()
+        black = products.filter(product_inf__parameter__name='Цвет', product_inf__value='черный')
+        facets = self.facets(param='Цвет:черный')
+        # значения ограниченного параметра считаются без его собственного ограничения
+        self.assertEqual(facets['Цвет'], direct_facets(products)['Цвет'])
+        self.assertEqual(facets['Память (ГБ)'], direct_facets(black)['Память (ГБ)'])
+
+    def test_counts_after_reimport(self):
+        seller = User.objects.get(email='seller1@example.com')
+        import_goods(seller, [goods_item(number, category=number % 2 + 1, parameters={'Цвет': 'красный'})
+                              for number in range(12)])
+        self.assertEqual(self.facets(), direct_facets(Product.objects.all()))
+        self.assertEqual(self.facets(category=1), direct_facets(Product.objects.filter(category_id=1)))
+
+
+    def test_removed_parameter(self):
+        seller = User.objects.get(email='seller1@example.com')
+        goods = [goods_item(number, category=number % 2 + 1) for number in range(20)]
+        del goods[5]['parameters']['Память (ГБ)']
+        importer = import_goods(seller, goods)
+        self.assertEqual(importer.stats['product_inf']['deleted'], 1)
+        product = Product.objects.get(name='Товар 5')
+        self.assertEqual(list(ProductInf.objects.filter(product=product).values_list(
+            'parameter__name', flat=True)), ['Цвет'])
+        self.assertEqual(self.facets(), expected_facets(goods))
+        # товар общий с вторым магазином, параметр пропадает из обоих предложений
+        self.assertEqual([offer.parameters for offer in CatalogOffer.objects.filter(product=product)],
+                         [goods[5]['parameters']] * 2)
+
+
+class ORJSONRendererTest(SimpleTestCase):
+    # ответы на orjson совпадают с ответами JSONRenderer из DRF байт в байт
+
+    def assertSameJSON(self, data):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_decimal(self):
+        self.assertSameJSON({'price': Decimal('12.50'), 'rate': Decimal('0.1'), 'list': [Decimal('3')]})
+
+    def test_datetime(self):
+        moment = datetime(2024, 5, 1, 12, 30, 15, 123456)
+        self.assertSameJSON({
+            'utc': moment.replace(tzinfo=dt_timezone.utc),
+            'utc_seconds': moment.replace(microsecond=0, tzinfo=dt_timezone.utc),
+            'offset': moment.replace(tzinfo=dt_timezone(timedelta(hours=3))),
+            'naive': moment,
+            'date': moment.date(),
+            'time': moment.time(),
+        })
+
+    def test_error_detail(self):
+        detail = ValidationError({'items': ['Обязательное поле.'],
+                                  'contact': {'phone': [ErrorDetail('Неверный номер', code='invalid')]}}).detail
+        self.assertSameJSON(detail)
+        self.assertSameJSON({'detail': ErrorDetail('Not found.', code='not_found')})
+
+    def test_line_separators(self):
+        self.assertSameJSON({'name': 'a\u2028b\u2029c', 1: 'ключ не строка'})
+
+
+class HTMLRenderer(BaseRenderer):
+    media_type = 'text/html'
+    format = 'html'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b'<html>csrf</html>'
+
+
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.seller = create_seller(1)
+        self.goods = [goods_item(number) for number in range(3)]
+        import_goods(self.seller, self.goods)
+
+    def test_cache_hit(self):
+        first = self.client.get('/products/')
+        # из кеша: только запрос версии ресурса
+        with self.assertNumQueries(1):
+            second = self.client.get('/products/')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+    def test_not_modified(self):
+        etag = self.client.get('/products/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_import_invalidates(self):
+        etag = self.client.get('/categories/')['ETag']
+        import_goods(self.seller, self.goods, categories=[{'id': 1, 'name': 'Телефоны'}])
+        response = self.client.get('/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Телефоны', [category['name'] for category in response.json()['results']])
+
+    def test_unchanged_import_keeps_etag(self):
+        etag = self.client.get('/products/')['ETag']
+        import_goods(self.seller, self.goods)
+        self.assertEqual(self.client.get('/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_checkout_invalidates_only_its_shop(self):
+        other = create_seller(2)
+        import_goods(other, [goods_item(number) for number in range(10, 13)])
+        buyer = create_user(1)
+        shops = {seller: seller.shop.id for seller in (self.seller, other)}
+        etags = {seller: self.client.get('/offers/', {'shop': shop})['ETag']
+                 for seller, shop in shops.items()}
+        products_etag = self.client.get('/products/')['ETag']
+        shop_product = ShopProduct.objects.filter(shop__seller=self.seller).order_by('id').first()
+        basket = save_items(buyer.id, {shop_product.id: 2}, replace=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(buyer.id, basket.id, buyer.contacts.get().id)
+        response = self.client.get('/offers/', {'shop': shops[self.seller]},
+                                   HTTP_IF_NONE_MATCH=etags[self.seller])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({offer['quantity'] for offer in response.json()['results']
+                          if offer['ext_id'] == shop_product.ext_id}, {shop_product.quantity - 2})
+        # ответы без позиций магазина из заказа и без остатков не устаревают
+        self.assertEqual(self.client.get('/offers/', {'shop': shops[other]},
+                                         HTTP_IF_NONE_MATCH=etags[other]).status_code, 304)
+        self.assertEqual(self.client.get('/products/', HTTP_IF_NONE_MATCH=products_etag).status_code, 304)
+
+    def test_only_seller_changes_invalidate_shops(self):
+        etag = self.client.get('/shops/')['ETag']
+        update_last_login(None, self.seller)
+        create_user(1).save()
+        self.assertEqual(self.client.get('/shops/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.seller.first_name = 'Иван'
+        self.seller.save()
+        self.assertEqual(self.client.get('/shops/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_html_not_cached(self):
+        with mock.patch.object(CategoryViewSet, 'renderer_classes', [ORJSONRenderer, HTMLRenderer]):
+            response = self.client.get('/categories/', HTTP_ACCEPT='text/html')
+            self.assertEqual(response.content, b'<html>csrf</html>')
+            self.assertFalse(response.has_header('ETag'))
+            self.assertIn('Cookie', response['Vary'])
+            with self.assertNumQueries(2):
+                self.client.get('/categories/', HTTP_ACCEPT='text/html')
+
+
+def rebuilt_offers():
+    # строки витрины, собранные заново из нормализованных таблиц
+    parameters = {}
+    for product_id, name, value in ProductInf.objects.values_list('product_id', 'parameter__name', 'value'):
+        parameters.setdefault(product_id, {})[name] = value
+    return {item.id: {'shop': item.shop_id, 'shop_name': item.shop.name, 'product': item.product_id,
+                      'name': item.product.name, 'model': item.product.model,
+                      'category': item.product.category_id, 'category_name': item.product.category.name,
+                      'ext_id': item.ext_id, 'quantity': item.quantity, 'price': item.price,
+                      'price_rrc': item.price_rrc, 'parameters': parameters.get(item.product_id, {})}
+            for item in ShopProduct.objects.select_related('shop', 'product__category')}
+
+
+def stored_offers():
+    return {offer.pop('shop_product'): offer for offer in CatalogOffer.objects.values(
+        'shop_product', 'shop', 'shop_name', 'product', 'name', 'model', 'category', 'category_name',
+        'ext_id', 'quantity', 'price', 'price_rrc', 'parameters')}
+
+
+class CatalogOfferTest(TestCase):
+
+    def setUp(self):
+        self.sellers = [create_seller(1), create_seller(2)]
+        self.goods = [goods_item(number, category=number % 2 + 1) for number in range(10)]
+        for seller in self.sellers:
+            import_goods(seller, self.goods)
+
+    def assertOffersConsistent(self):
+        self.assertEqual(stored_offers(), rebuilt_offers())
+
+    def test_import(self):
+        self.assertEqual(CatalogOffer.objects.count(), 20)
+        self.assertOffersConsistent()
+
+    def test_price_change(self):
+        self.goods[0]['price'] = 1500
+        self.goods[1]['quantity'] = 0
+        import_goods(self.sellers[0], self.goods)
+        self.assertOffersConsistent()
+        self.assertEqual(CatalogOffer.objects.get(shop__seller=self.sellers[0], ext_id=0).price, 1500)
+
+    def test_category_rename(self):
+        import_goods(self.sellers[0], self.goods, categories=[{'id': 1, 'name': 'Телефоны'},
+                                                              {'id': 2, 'name': 'Аксессуары'}])
+        self.assertOffersConsistent()
+        # переименование видно и в предложениях другого магазина
+        self.assertEqual(set(CatalogOffer.objects.filter(category_id=1).values_list(
+            'category_name', flat=True)), {'Телефоны'})
+
+    def test_category_change(self):
+        self.goods[0]['category'] = 2
+        import_goods(self.sellers[0], self.goods)
+        self.assertOffersConsistent()
+        self.assertEqual(CatalogOffer.objects.get(shop__seller=self.sellers[0], ext_id=0).category_id, 2)
+
+    def test_parameter_change_and_removed_goods(self):
+        self.goods[3]['parameters']['Цвет'] = 'синий'
+        import_goods(self.sellers[0], self.goods[:8])
+        self.assertOffersConsistent()
+        # параметры общего товара меняются и в предложении второго магазина
+        self.assertEqual(CatalogOffer.objects.get(shop__seller=self.sellers[1], ext_id=3).parameters['Цвет'],
+                         'синий')
+        self.assertEqual(CatalogOffer.objects.filter(shop__seller=self.sellers[0]).count(), 8)
+
+    def test_single_saves(self):
+        shop_product = ShopProduct.objects.filter(shop__seller=self.sellers[1]).first()
+        shop_product.price = 777
+        shop_product.save()
+        category = Category.objects.get(id=2)
+        category.name = 'Чехлы'
+        category.save()
+        shop = self.sellers[1].shop
+        shop.name = 'Другой магазин'
+        shop.save()
+        self.assertOffersConsistent()
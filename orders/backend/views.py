@@ -1,21 +1,34 @@
-from django.shortcuts import render
 from .forms import UploadFileForm
-from django.http import JsonResponse
+from django.http import HttpResponse
 from rest_framework.views import APIView
-from backend.models import Shop, ShopFiles, Category, Product, ShopProduct, Parameter, ProductInf, ConfirmEmailToken, Contact, User
-import yaml
-from orders.settings import BASE_DIR, DATA_ROOT
-import os
+from backend.models import Shop, Category, Product, ShopProduct, Parameter, ProductInf, ConfirmEmailToken, Contact, ImportJob, CatalogOffer, Order, ShopOrder, STATE_CHOICES
 from django.contrib.auth.password_validation import validate_password
-from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductSerializer, ShopProductSerializer, ProductInfSerializer, ContactSerializer
-from backend.signals import new_user_registered, new_order
+from backend.serializers import UserSerializer, CategorySerializer, ShopSerializer, ProductSerializer, ShopProductSerializer, ProductInfSerializer, ContactSerializer, ImportJobSerializer, CatalogOfferSerializer, BasketSerializer, OrderSerializer, ShopOrderSerializer
+from backend.signals import new_user_registered
+from backend.price_list import import_price_list
+from backend.parallel_import import import_price_list_parallel
+from backend.jobs import file_checksum, last_applied_checksum
+from backend.metrics import registry
+from backend.notifications import queue_metrics
+from backend.mixins import EagerLoadingMixin
+from backend.search import ProductSearchFilter
+from backend.facets import ParameterFilter, facet_counts
+from backend.response_cache import CachedResponseMixin
+from backend.db.router import ReplicaReadMixin
+from backend.read_model import OfferFilter
+from backend.pagination import ShopOrderCursorPagination
+from backend.renderers import JsonResponse
+from backend.basket import BasketError, items_queryset, load_basket, parse_ids, parse_items, remove_items, save_items
+from backend.checkout import CheckoutError, place_order
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from rest_framework.viewsets import ModelViewSet
-from rest_framework import filters
+from rest_framework.generics import ListAPIView
+from rest_framework.decorators import action
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Sum, F
+from django.db.models import Prefetch, Q
+from django.db import transaction
 
 
 class RegisterAccount(APIView):
@@ -33,11 +46,13 @@ class RegisterAccount(APIView):
                 user_serializer = UserSerializer(data=request.data)
                 # проверка уникальности имени пользователя и его сохранение
                 if user_serializer.is_valid():
-                    user = user_serializer.save()
-                    user.set_password(request.data['password'])
-                    user.save()
-                    new_user_registered.send(
-                        sender=self.__class__, user_id=user.id)
+                    # письмо с токеном ставится в очередь в той же транзакции
+                    with transaction.atomic():
+                        user = user_serializer.save()
+                        user.set_password(request.data['password'])
+                        user.save()
+                        new_user_registered.send(
+                            sender=self.__class__, user_id=user.id)
                     return JsonResponse({'Status': True})
                 else:
                     return JsonResponse({'Status': False, 'Errors': user_serializer.errors})
@@ -104,6 +119,129 @@ class LoginAccount(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Необходимо указать все требуемые аргументы'})
 
 
+class LogoutAccount(APIView):
+    def post(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        # удаление токена сбрасывает его в кеше аутентификации
+        Token.objects.filter(user_id=request.user.id).delete()
+        return JsonResponse({'Status': True})
+
+
+class BasketView(APIView):
+    """
+    Корзина покупателя: получение, добавление позиций (POST), замена
+    количества (PUT) и удаление позиций (DELETE, items - id позиций
+    магазина через запятую). Ответ - содержимое корзины после изменения
+    """
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        return self.basket_response(load_basket(request.user.id))
+
+    def post(self, request, *args, **kwargs):
+        return self.save(request, replace=False)
+
+    def put(self, request, *args, **kwargs):
+        return self.save(request, replace=True)
+
+    def delete(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        if not request.data.get('items'):
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        try:
+            basket = remove_items(request.user.id, parse_ids(request.data['items']))
+        except BasketError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+        return self.basket_response(basket)
+
+    def save(self, request, replace):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        if not request.data.get('items'):
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        try:
+            basket = save_items(request.user.id, parse_items(request.data['items']), replace)
+        except BasketError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error)})
+        return self.basket_response(basket)
+
+    @staticmethod
+    def basket_response(basket):
+        if basket is None:
+            return Response({'id': None, 'state': 'basket', 'ordered_items': [], 'total_sum': 0,
+                             'items_count': 0})
+        return Response(BasketSerializer(basket).data)
+
+
+class OrderView(APIView):
+    """
+    Заказы покупателя: список оформленных заказов и оформление заказа
+    из корзины (POST id корзины и contact) со списанием остатков.
+    Список сортируется параметром ordering (dt, total_sum, с минусом - по
+    убыванию) и фильтруется по сумме total_sum_min/total_sum_max
+    """
+    ordering_fields = ('dt', '-dt', 'total_sum', '-total_sum')
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        orders = Order.objects.filter(user_id=request.user.id).exclude(state='basket')
+        ordering = request.query_params.get('ordering', '-dt')
+        if ordering not in self.ordering_fields:
+            return JsonResponse({'Status': False, 'Errors': f'Неверная сортировка: {ordering}'})
+        for param, lookup in (('total_sum_min', 'total_sum__gte'), ('total_sum_max', 'total_sum__lte')):
+            value = request.query_params.get(param)
+            if value is None:
+                continue
+            if not value.isdigit():
+                return JsonResponse({'Status': False, 'Errors': f'Неверное значение {param}'})
+            orders = orders.filter(**{lookup: int(value)})
+        orders = orders.order_by(ordering, '-id').prefetch_related(
+            Prefetch('ordered_items', queryset=items_queryset()))
+        return Response(OrderSerializer(orders, many=True).data)
+
+    def post(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        if not {'id', 'contact'}.issubset(request.data) or not all(
+                str(request.data[key]).isdigit() for key in ('id', 'contact')):
+            return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
+        try:
+            order = place_order(request.user.id, int(request.data['id']), int(request.data['contact']))
+        except CheckoutError as error:
+            return JsonResponse({'Status': False, 'Errors': str(error), 'Failed': error.failed})
+        return JsonResponse({'Status': True, 'Order': order.id})
+
+
+class ShopOrders(ListAPIView):
+    """
+    Заказы магазина продавца в статусе state (по умолчанию 'new') от новых
+    к старым, постранично по курсору
+    """
+    serializer_class = ShopOrderSerializer
+    pagination_class = ShopOrderCursorPagination
+    states = {state for state, _ in STATE_CHOICES if state != 'basket'}
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        if request.user.type != 'seller':
+            return JsonResponse({'Status': False, 'Error': 'Только для магазинов'}, status=403)
+        if request.query_params.get('state', 'new') not in self.states:
+            return JsonResponse({'Status': False, 'Errors': 'Неверный статус заказа'})
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return ShopOrder.objects.filter(
+            shop__seller_id=self.request.user.id,
+            state=self.request.query_params.get('state', 'new')).select_related(
+            'order__user_contact', 'order__user').prefetch_related(
+            Prefetch('items', queryset=items_queryset()))
+
+
 class ShopUpload(APIView):
     def post(self, request):
         if not request.user.is_authenticated:
@@ -112,51 +250,40 @@ class ShopUpload(APIView):
             return JsonResponse({'Status': False, 'Error': 'Вход только для магазинов'}, status=403)
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
-            form.save()
-            file = request.FILES.popitem()
-            self.handle_uploaded_file(os.path.join(
-                DATA_ROOT, str(file[1][0])), request.user.id)
-            return JsonResponse({'Status': True})
+            checksum = file_checksum(request.FILES['file'].chunks())
+            if checksum == last_applied_checksum(request.user.id):
+                return JsonResponse({'Status': True, 'Skipped': True})
+            shop_file = form.save(commit=False)
+            shop_file.checksum = checksum
+            shop_file.save()
+            # файл ставится в очередь, импорт выполняет команда import_worker
+            job = ImportJob.objects.create(
+                user_id=request.user.id, file=shop_file)
+            return JsonResponse({'Status': True, 'Job': job.id}, status=202)
         else:
             return JsonResponse({'Status': False})
 
-    def handle_uploaded_file(sefl, shop_file, user):
-        shop = Shop()
-        product = Product()
-        parameter = Parameter()
-        with open(shop_file, 'r', encoding='utf8') as stream:
-            try:
-                shop_data = yaml.safe_load(stream)
-                shop.name = shop_data['shop']
-                seller = User.objects.filter(id=user).first()
-                shop.seller = seller
-                shop.save()
-                for category in shop_data['categories']:
-                    category_object, _ = Category.objects.get_or_create(
-                        id=category['id'], name=category['name'])
-                    category_object.shops.add(shop)
-                    category_object.save()
-                for goods in shop_data['goods']:
-                    category = Category.objects.get(id=goods['category'])
-                    product_object, _ = Product.objects.get_or_create(name=goods['name'], model=goods['model'],
-                                                                      category=category)
-                    product_object.save()
-                    prod_pk = Product.objects.filter(
-                        name=goods['name']).first()
-                    shopproduct_object, _ = ShopProduct.objects.get_or_create(
-                        ext_id=goods['id'], quantity=goods['quantity'], price=goods['price'], price_rrc=goods['price_rrc'], product=prod_pk, shop=shop)
-                    shopproduct_object.save()
-                    for parameters, value in goods['parameters'].items():
-                        parameter_object, _ = Parameter.objects.get_or_create(
-                            name=parameters)
-                        parameter_object.save()
-                        param_obj_pk = Parameter.objects.filter(
-                            name=parameters).first()
-                        product_inf_object, _ = ProductInf.objects.get_or_create(
-                            value=value, parameter=param_obj_pk, product=prod_pk)
-                        product_inf_object.save()
-            except yaml.YAMLError as exc:
-                return JsonResponse({'Status': False, 'Error': str(exc)})
+    def handle_uploaded_file(self, shop_file, user, processes=None):
+        # синхронный импорт всего файла одной транзакцией;
+        # processes > 1 включает параллельный разбор товаров
+        if processes and processes > 1:
+            with open(shop_file, 'r', encoding='utf8') as stream, transaction.atomic():
+                importer = import_price_list_parallel(stream, user, processes)
+        else:
+            with open(shop_file, 'rb') as stream, transaction.atomic():
+                importer = import_price_list(stream, user)
+        return importer.result()
+
+
+class ShopUploadStatus(APIView):
+    def get(self, request, job_id, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'Status': False, 'Error': 'Log in required'}, status=403)
+        job = ImportJob.objects.filter(
+            id=job_id, user_id=request.user.id).first()
+        if job is None:
+            return JsonResponse({'Status': False, 'Error': 'Задача не найдена'}, status=404)
+        return JsonResponse({'Status': True, 'Job': ImportJobSerializer(job).data})
 
 
 class UserContact(APIView):
@@ -219,13 +346,21 @@ class UserContact(APIView):
         return JsonResponse({'Status': False, 'Errors': 'Не указаны все необходимые аргументы'})
 
 
-class CategoryViewSet(ModelViewSet):
+def metrics(request):
+    # метрики текущего процесса в текстовом формате Prometheus
+    return HttpResponse(registry.render() + queue_metrics(),
+                        content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class CategoryViewSet(ReplicaReadMixin, CachedResponseMixin, EagerLoadingMixin, ModelViewSet):
+    cache_resource = 'categories'
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     http_method_names = ['get', ]
 
 
-class ShopViewSet(ModelViewSet):
+class ShopViewSet(ReplicaReadMixin, CachedResponseMixin, EagerLoadingMixin, ModelViewSet):
+    cache_resource = 'shops'
     queryset = Shop.objects.all()
     serializer_class = ShopSerializer
     filter_backends = [DjangoFilterBackend]
@@ -233,28 +368,49 @@ class ShopViewSet(ModelViewSet):
     http_method_names = ['get', ]
 
 
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, CachedResponseMixin, EagerLoadingMixin, ModelViewSet):
+    cache_resource = 'products'
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name', 'model']
+    filter_backends = [ProductSearchFilter, ParameterFilter]
     http_method_names = ['get', ]
 
+    @action(detail=False)
+    def facets(self, request):
+        # страница подходящих товаров и счётчики значений параметров
+        page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        response = self.get_paginated_response(
+            self.get_serializer(page, many=True).data)
+        response.data['facets'] = facet_counts(request, self)
+        return response
+
 
-class ShopProductViewSet(ModelViewSet):
+class ShopProductViewSet(ReplicaReadMixin, CachedResponseMixin, EagerLoadingMixin, ModelViewSet):
+    cache_resource = 'products_in_shop'
     queryset = ShopProduct.objects.all()
     serializer_class = ShopProductSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['product__model', 'product__name']
+    filter_backends = [ProductSearchFilter, ParameterFilter]
+    search_product_path = 'product__'
     http_method_names = ['get', ]
 
 
-class ProductInfViewSet(ModelViewSet):
+class ProductInfViewSet(ReplicaReadMixin, CachedResponseMixin, EagerLoadingMixin, ModelViewSet):
+    cache_resource = 'product_inf'
     queryset = ProductInf.objects.all()
     serializer_class = ProductInfSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['product_inf_id__product_id__model',
-                     'product_inf_id__product_id__name']
+    filter_backends = [ProductSearchFilter, ParameterFilter]
+    search_product_path = 'product__'
+    http_method_names = ['get', ]
+
+
+class CatalogOfferViewSet(ReplicaReadMixin, CachedResponseMixin, ModelViewSet):
+    # предложения магазинов из витрины CatalogOffer, без соединений таблиц
+    cache_resource = 'offers'
+    queryset = CatalogOffer.objects.all()
+    serializer_class = CatalogOfferSerializer
+    filter_backends = [ProductSearchFilter, OfferFilter]
+    search_product_path = 'product__'
     http_method_names = ['get', ]
 
 
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -37,11 +39,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'backend',
     'rest_framework.authtoken',
 ]
 
 MIDDLEWARE = [
+    'backend.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,17 +79,60 @@ WSGI_APPLICATION = 'orders.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# режим соединений с БД (DB_CONN_MODE):
+# close - новое соединение на каждый запрос;
+# persistent - соединение потока живёт DB_CONN_MAX_AGE секунд и
+#   проверяется перед первым использованием в очередном запросе;
+# pool - пул соединений процесса (backend.db.pool) для import_worker и
+#   ASGI, соединение возвращается в пул в конце каждого запроса
+DB_CONN_MODE = os.environ.get('DB_CONN_MODE', 'persistent')
+if DB_CONN_MODE not in ('close', 'persistent', 'pool'):
+    raise ImproperlyConfigured(f'Неизвестный режим соединений DB_CONN_MODE={DB_CONN_MODE}')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'backend.db.pool' if DB_CONN_MODE == 'pool' else 'django.db.backends.postgresql',
         'NAME': 'diplom',
         'HOST': '127.0.0.1',
         'PORT': '5432',
         'USER': 'postgres',
         'PASSWORD': 'postgres',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)) if DB_CONN_MODE == 'persistent' else 0,
+        'CONN_HEALTH_CHECKS': DB_CONN_MODE != 'close' and os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'MAX_IDLE': int(os.environ.get('DB_POOL_MAX_IDLE', os.environ.get('DB_POOL_MAX_SIZE', 10))),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
     }
 }
 
+# реплики для чтения каталога: DB_REPLICAS=хост[:порт][/имя БД],... создаёт
+# алиасы replica_1, replica_2, ... с остальными параметрами default;
+# локально можно указать вторую БД на том же сервере: 127.0.0.1/diplom_replica
+REPLICA_DATABASES = []
+for number, replica in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    address, separator, name = replica.strip().rpartition('/')
+    if not separator:
+        address, name = name, ''
+    host, _, port = address.partition(':')
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+# реплика с большим отставанием (сек.) не используется до следующей проверки
+REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('DB_REPLICA_CHECK_INTERVAL', 5))
+
+DATABASE_ROUTERS = ['backend.db.router.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -130,20 +177,89 @@ DATA_ROOT = os.path.join(BASE_DIR, 'uploaded_data')
 DATA_URL = '/uploaded_data/'
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
+# словарь PostgreSQL для полнотекстового поиска товаров
+SEARCH_CONFIG = 'russian'
+
+# запросы, выполнившие больше запросов к БД, попадают в лог backend.metrics
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 50))
+
+# кеш ответов каталога; по умолчанию свой LRU в памяти каждого процесса,
+# для общего кеша подходят FileBasedCache или DatabaseCache
+# (для него нужна команда createcachetable)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': os.environ.get('CATALOG_CACHE_BACKEND',
+                                  'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CATALOG_CACHE_LOCATION', 'catalog'),
+        'TIMEOUT': int(os.environ.get('CATALOG_CACHE_TIMEOUT', 600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', 1000)),
+        },
+    },
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'backend.authentication.CachedTokenAuthentication',
     ),
 
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
-    ]
+    ],
+
+    'DEFAULT_PAGINATION_CLASS': 'backend.pagination.CatalogCursorPagination',
+
+    # JSON на orjson (backend.renderers), без него - стандартный json
+    'DEFAULT_RENDERER_CLASSES': [
+        'backend.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'backend.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-EMAIL_HOST = 'smtp.mailtrap.io'
-EMAIL_PORT = '2525'
+# кеш проверенных токенов в памяти процесса: число токенов и время жизни записи (сек.),
+# после деактивации пользователя в других процессах токен действует не дольше TTL
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 60))
+
+# для проверки без почтового сервера: EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend
+# и EMAIL_FILE_PATH или локальный отладочный SMTP-сервер в EMAIL_HOST/EMAIL_PORT
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.mailtrap.io')
+EMAIL_PORT = os.environ.get('EMAIL_PORT', '2525')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', 30))
 EMAIL_HOST_USER = 'login'  # заменить на реальные значения
 EMAIL_HOST_PASSWORD = 'password'  # заменить на реальные значения
 SERVER_EMAIL = EMAIL_HOST_USER
+
+# очередь писем (backend.outbox): размер пакета на одно SMTP-соединение,
+# число попыток и пауза перед повтором, удваивающаяся с каждой попыткой (сек.)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE', 50))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get('EMAIL_OUTBOX_RETRY_DELAY', 60))
+EMAIL_OUTBOX_MAX_RETRY_DELAY = int(os.environ.get('EMAIL_OUTBOX_MAX_RETRY_DELAY', 3600))
+# через сколько секунд письма пакета, отправитель которого остановился, забираются
+# снова; должно быть больше времени отправки пакета (BATCH_SIZE * EMAIL_TIMEOUT)
+EMAIL_OUTBOX_SEND_TIMEOUT = int(os.environ.get('EMAIL_OUTBOX_SEND_TIMEOUT', 1800))
+
+# изменения статусов заказов покупателя за это время (сек.) объединяются в одно письмо
+ORDER_NOTIFY_WINDOW = int(os.environ.get('ORDER_NOTIFY_WINDOW', 30))
+
+# ожидание блокировки остатков при оформлении заказа (мс): при длинной очереди
+# на одну позицию покупатель получает ошибку вместо зависшего запроса
+CHECKOUT_LOCK_TIMEOUT = int(os.environ.get('CHECKOUT_LOCK_TIMEOUT', 2000))
+
+# задачи импорта: период отметки обработчика (сек.), через сколько секунд без
+# отметки задача возвращается в очередь и сколько раз её можно запускать
+IMPORT_JOB_HEARTBEAT = int(os.environ.get('IMPORT_JOB_HEARTBEAT', 30))
+IMPORT_JOB_TIMEOUT = int(os.environ.get('IMPORT_JOB_TIMEOUT', 300))
+IMPORT_JOB_MAX_ATTEMPTS = int(os.environ.get('IMPORT_JOB_MAX_ATTEMPTS', 3))
@@ -15,7 +15,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from backend.views import ShopUpload, RegisterAccount, ConfirmAccount, LoginAccount, CategoryViewSet, ShopViewSet, ProductViewSet, ShopProductViewSet, ProductInfViewSet, UserContact
+from backend.views import ShopUpload, ShopUploadStatus, RegisterAccount, ConfirmAccount, LoginAccount, LogoutAccount, AccountDetails, BasketView, OrderView, ShopOrders, CategoryViewSet, ShopViewSet, ProductViewSet, ShopProductViewSet, ProductInfViewSet, CatalogOfferViewSet, UserContact, metrics
 from rest_framework.routers import DefaultRouter
 
 
@@ -25,11 +25,20 @@ r.register('shops', ShopViewSet)
 r.register('products', ProductViewSet)
 r.register('products_in_shop', ShopProductViewSet)
 r.register('product_inf', ProductInfViewSet)
+r.register('offers', CatalogOfferViewSet)
 urlpatterns = r.urls
 urlpatterns += [path('admin/', admin.site.urls)]
 urlpatterns += [path('shop/upload', ShopUpload.as_view(), name='shop-upload')]
+urlpatterns += [path('shop/upload/<int:job_id>',
+                     ShopUploadStatus.as_view(), name='shop-upload-status')]
 urlpatterns += [path('user/register',
                      RegisterAccount.as_view(), name='user-register')]
 urlpatterns += [path('user/register/confirm',
                      ConfirmAccount.as_view(), name='user-register-confirm')]
 urlpatterns += [path('user/login', LoginAccount.as_view(), name='user-login')]
+urlpatterns += [path('user/logout', LogoutAccount.as_view(), name='user-logout')]
+urlpatterns += [path('user/details', AccountDetails.as_view(), name='user-details')]
+urlpatterns += [path('basket', BasketView.as_view(), name='basket')]
+urlpatterns += [path('order', OrderView.as_view(), name='order')]
+urlpatterns += [path('shop/orders', ShopOrders.as_view(), name='shop-orders')]
+urlpatterns += [path('metrics', metrics, name='metrics')]